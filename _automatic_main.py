@@ -5,14 +5,15 @@ from automatic_editing import (
     complex_operations as co,
     regexes
 )
+from automatic_editing.indexed_tree import IndexedTree
 
 
 GENRE = 'Leserbriefe-pos-BB-neu-optimiert-RR'
 FILE_ = f'/home/bruno/Desktop/Databases/Moralization/Zeitungstexte/{GENRE}.xmi'
 
 
-tree, root = xh.parse_xmi(FILE_)
-namespaces = xh.get_namespaces(FILE_)
+tree, root, namespaces = xh.get_everything(FILE_)
+tree = IndexedTree(tree, namespaces)
 
 tree = ed.rename_annotation(
     tree, 'Protagonistinnen', 'Adresassat:in', 'Adressat:in'
@@ -30,20 +31,18 @@ tree = se.sofa_regex_replace(
     " ###",
     '',
     tree,
-    namespaces
+    namespaces,
+    batched=True
 )
 
 tree = se.sofa_regex_replace(
     "#",
     '',
     tree,
-    namespaces
+    namespaces,
+    batched=True
 )
 
-
-before = xh.get_position_before_category(
-    tree, '{'+namespaces['custom']+'}Span')
-
 tree = co.add_metadata_tag(
     regexes.ZEITUNG_PATTERN_EDIT,
     {
@@ -51,24 +50,20 @@ tree = co.add_metadata_tag(
         'sofa': '1'
     },
     tree,
-    namespaces,
-    before
+    namespaces
 )
 
-tree = co.correct_sentences(tree, namespaces)
+tree = co.correct_sentences(tree, namespaces, sentence_begin=None)
 
 tree = ed.push_out_annotations(
     tree, namespaces,
     'custom:Metadata',
     ['custom:Span']
 )
-tree = ed.push_out_annotations(
-    tree, namespaces,
-    'custom:Metadata',
-    ['custom:Span']
-)
+removed = {}
+
 tree = co.delete_keine_moral(
-    tree, namespaces
+    tree, namespaces, counts=removed, append=True
 )
 tree = ed.push_out_annotations(
     tree, namespaces,
@@ -76,15 +71,14 @@ tree = ed.push_out_annotations(
     ['custom:Span']
 )
 
-tree = ed.narrow_all_tag_cords('custom:Span', tree, namespaces)
-tree = co.include_punctuation(tree, namespaces)
-tree = co.remove_double_moralizations(tree, namespaces)
+tree = co.cleanup_annotations(tree, namespaces, counts=removed)
 
-tree = ed.delete_empty_tags(tree, namespaces)
-tree = ed.delete_whitespace_tokens(tree, namespaces)
-tree = ed.delete_overlap_tokens(tree, namespaces)
-tree = ed.delete_outside_sentence(tree, namespaces)
+for tag, count in removed.items():
+    print(f'Removed {count} {tag} elements.')
 
+tree = ed.canonical_order(
+    tree, namespaces, type_order=['custom:Metadata', 'custom:Span']
+)
 tree = ed.update_ids(tree, namespaces)
 tree = ed.set_sofa_one(tree, namespaces)
 tree = ed.delete_group_annotation(tree, namespaces)
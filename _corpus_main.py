@@ -0,0 +1,37 @@
+import argparse
+from automatic_editing import corpus
+from automatic_editing.build_cache import BuildCache
+
+
+parser = argparse.ArgumentParser(
+    description='Runs a pipeline definition over all xmi files of a '
+                'directory tree.'
+)
+parser.add_argument('config', help='.json or .toml pipeline definition')
+parser.add_argument('input_dir', help='directory with the xmi files')
+parser.add_argument('output_dir', help='directory for the edited files')
+parser.add_argument(
+    '--workers', type=int,
+    help='number of worker processes, all cores by default'
+)
+parser.add_argument('--backend', help='lxml or etree')
+parser.add_argument('--cache', help='directory of the build cache')
+parser.add_argument(
+    '--cache-mb', type=float,
+    help='size cap of the build cache in megabytes'
+)
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    cache = None
+    if args.cache:
+        cache = BuildCache(
+            args.cache,
+            None if args.cache_mb is None else int(args.cache_mb * 1e6)
+        )
+    results = corpus.run_corpus(
+        args.config, args.input_dir, args.output_dir,
+        args.workers, args.backend, cache
+    )
+    print(corpus.format_summary(results))
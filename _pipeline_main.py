@@ -0,0 +1,39 @@
+import argparse
+from automatic_editing import pipeline
+from automatic_editing.build_cache import BuildCache
+
+
+parser = argparse.ArgumentParser(
+    description='Runs a pipeline definition over an xmi file.'
+)
+parser.add_argument('config', help='.json or .toml pipeline definition')
+parser.add_argument('input', help='xmi file to be edited')
+parser.add_argument('output', help='path of the edited xmi file')
+parser.add_argument(
+    '--resume', default=0,
+    help='index or name of the step to resume from'
+)
+parser.add_argument(
+    '--checkpoints',
+    help='directory to write the document to after every step'
+)
+parser.add_argument('--cache', help='directory of the build cache')
+parser.add_argument(
+    '--cache-mb', type=float,
+    help='size cap of the build cache in megabytes'
+)
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    cache = None
+    if args.cache:
+        cache = BuildCache(
+            args.cache,
+            None if args.cache_mb is None else int(args.cache_mb * 1e6)
+        )
+    start = int(args.resume) if str(args.resume).isdigit() else args.resume
+    reports = pipeline.run_pipeline_file(
+        args.config, args.input, args.output, start, args.checkpoints, cache
+    )
+    print(pipeline.format_reports(reports))
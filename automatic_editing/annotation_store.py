@@ -0,0 +1,284 @@
+from . import xmi_handling as xh
+from . import xmi_conversion_util as xcu
+from .indexed_tree import set_children
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+DEFAULT_TAGS = (
+    'type5:Token', 'type5:Sentence', 'custom:Span', 'custom:Metadata'
+)
+WHITESPACE = ' \n\t'
+
+
+class _Columns:
+    """Offsets and dictionary-encoded attributes of the elements of a tag."""
+
+    def __init__(self, tag, elements):
+        self.tag = tag
+        self.elements = elements
+        size = len(elements)
+        self.has_coords = np.zeros(size, dtype=bool)
+        self.begins = np.zeros(size, dtype=np.int64)
+        self.ends = np.zeros(size, dtype=np.int64)
+        self.alive = np.ones(size, dtype=bool)
+        # Deleted elements already added to a counts dict
+        self.counted = np.zeros(size, dtype=bool)
+        self.attributes = {}
+
+        for row, element in enumerate(elements):
+            try:
+                self.begins[row] = int(element.get('begin'))
+                self.ends[row] = int(element.get('end'))
+                self.has_coords[row] = True
+            except (TypeError, ValueError):
+                pass
+            for key, value in element.attrib.items():
+                if key not in ('begin', 'end'):
+                    column = self._column(key)
+                    column[row] = self._code(key, value)
+
+        self.saved_begins = self.begins.copy()
+        self.saved_ends = self.ends.copy()
+        self.dirty_attributes = set()
+
+    def _column(self, key):
+        if key not in self.attributes:
+            self.attributes[key] = (
+                np.full(len(self.elements), -1, dtype=np.int32), [], {}
+            )
+        return self.attributes[key][0]
+
+    def _code(self, key, value):
+        _, values, index = self.attributes[key]
+        if value not in index:
+            index[value] = len(values)
+            values.append(value)
+        return index[value]
+
+
+class AnnotationStore:
+    """Columnar copy of the annotations of a tree, backed by numpy arrays.
+
+    Begin and end of every element are parsed into int arrays once, grouped
+    by tag, and the other attributes are kept as dictionary-encoded columns.
+    Offset changes are applied to whole arrays at once and only written
+    back to the elements by write_back, so any number of edits costs a
+    single pass over the xml. While a store is in use, the begin and end
+    attributes of the tree are stale.
+
+    adjust_annotations, adjust_annotations_batched, narrow_all_tag_cords
+    and delete_empty_tags accept a store in place of the tree.
+
+    Args:
+        tree (ElementTree object): tree whose annotations are stored
+        namespaces (dict): namespace dictionary the tree uses
+        tags (iterable): tags like 'custom:Span' to be stored
+
+    Raises:
+        ImportError: if numpy is not installed
+    """
+
+    def __init__(self, tree, namespaces, tags=DEFAULT_TAGS):
+        if np is None:
+            raise ImportError('AnnotationStore requires numpy.')
+        self.tree = tree
+        self.namespaces = namespaces
+        self.groups = {}
+        for tag in tags:
+            qualified = xh.qualified_tag(tag, namespaces)
+            self.groups[qualified] = _Columns(
+                qualified, tree.findall(tag, namespaces)
+            )
+
+    def _select(self, tags):
+        if tags is None:
+            return list(self.groups.values())
+        return [
+            self.groups[xh.qualified_tag(tag, self.namespaces)]
+            for tag in tags
+        ]
+
+    def shift(self, change_len, position, tags=None):
+        """Shifts offsets like adjust_annotations does for a single edit."""
+        for group in self._select(tags):
+            group.begins[group.begins >= position] += change_len
+            group.ends[group.ends >= position + 1] += change_len
+
+    def remap(self, tables, tags=None):
+        """Shifts offsets through the delta tables of
+        sofa_editing.offset_tables, like adjust_annotations_batched."""
+        for group in self._select(tags):
+            for thresholds, deltas in tables:
+                thresholds = np.asarray(thresholds, dtype=np.int64)
+                deltas = np.asarray(deltas, dtype=np.int64)
+                group.begins += deltas[
+                    np.searchsorted(thresholds, group.begins, side='right')
+                ]
+                group.ends += deltas[
+                    np.searchsorted(thresholds, group.ends, side='left')
+                ]
+
+    def narrow(self, text, tags=None):
+        """Narrows offsets to exclude surrounding whitespace, like
+        xmi_conversion_util.narrow_coords does for a single element."""
+        length = len(text)
+        if length == 0:
+            return
+        codepoints = np.frombuffer(
+            text.encode('utf-32-le'), dtype=np.uint32
+        )
+        whitespace = np.isin(
+            codepoints, [ord(char) for char in WHITESPACE]
+        )
+        positions = np.arange(length)
+        # First non-whitespace char at or after each position
+        following = np.minimum.accumulate(
+            np.where(whitespace, length - 1, positions)[::-1]
+        )[::-1]
+        # Last non-whitespace char at or before each position
+        preceding = np.maximum.accumulate(
+            np.where(whitespace, -1, positions)
+        )
+
+        for group in self._select(tags):
+            begins = np.where(
+                group.begins > length, length - 1, group.begins
+            )
+            ends = np.minimum(group.ends, length)
+            regular = (
+                group.has_coords & group.alive
+                & (begins >= 0) & (begins < length) & (ends >= 1)
+            )
+            regular[regular] &= preceding[ends[regular] - 1] >= 0
+
+            group.begins[regular] = following[begins[regular]]
+            group.ends[regular] = preceding[ends[regular] - 1] + 1
+
+            # Leave out-of-range oddities to the original implementation
+            for row in np.flatnonzero(
+                group.has_coords & group.alive & ~regular
+            ):
+                begin, end = xcu.narrow_coords(
+                    (int(group.begins[row]), int(group.ends[row])), text
+                )
+                group.begins[row] = begin
+                group.ends[row] = end
+
+    def delete_empty(self, tags=None, counts=None):
+        """Marks elements with empty or negative ranges as deleted.
+
+        Args:
+            tags (iterable): tags to be checked, all stored tags if None
+            counts (dict): if given, the number of deleted elements is
+                added per tag. write_back does not count them again
+        """
+        for group in self._select(tags):
+            empty = group.alive & group.has_coords & (
+                (group.begins >= group.ends)
+                | (group.begins < 0) | (group.ends < 0)
+            )
+            group.alive &= ~empty
+            if counts is not None and empty.any():
+                counts[group.tag] = (
+                    counts.get(group.tag, 0) + int(empty.sum())
+                )
+                group.counted |= empty
+
+    def labels(self, tag, attribute):
+        """Gets the values of an attribute for all live elements of a tag,
+        None where the attribute is missing."""
+        group = self.groups[xh.qualified_tag(tag, self.namespaces)]
+        if attribute not in group.attributes:
+            return [None] * int(group.alive.sum())
+        codes, values, _ = group.attributes[attribute]
+        return [
+            values[code] if code >= 0 else None
+            for code in codes[group.alive]
+        ]
+
+    def mask(self, tag, attribute, value=None):
+        """Gets a boolean array of the elements of a tag having the
+        attribute (with the given value, if any)."""
+        group = self.groups[xh.qualified_tag(tag, self.namespaces)]
+        if attribute not in group.attributes:
+            return np.zeros(len(group.elements), dtype=bool)
+        codes, _, index = group.attributes[attribute]
+        if value is None:
+            return codes >= 0
+        return codes == index.get(value, -2)
+
+    def set_label(self, tag, attribute, rows, value):
+        """Sets an attribute to a value for the rows selected by a mask
+        or index array."""
+        group = self.groups[xh.qualified_tag(tag, self.namespaces)]
+        column = group._column(attribute)
+        column[rows] = group._code(attribute, value)
+        group.dirty_attributes.add(attribute)
+
+    def count(self, tag):
+        """Gets the number of live elements of a tag."""
+        group = self.groups[xh.qualified_tag(tag, self.namespaces)]
+        return int(group.alive.sum())
+
+    def write_back(self, counts=None):
+        """Writes changed offsets and labels to the elements and removes
+        deleted elements from the tree, all in one pass.
+
+        Args:
+            counts (dict): if given, the number of removed elements is
+                added per tag, except for those delete_empty counted
+
+        Returns:
+            ElementTree object: the updated tree
+        """
+        removed = set()
+        for tag, group in self.groups.items():
+            changed = group.has_coords & group.alive & (
+                (group.begins != group.saved_begins)
+                | (group.ends != group.saved_ends)
+            )
+            for row in np.flatnonzero(changed):
+                element = group.elements[row]
+                element.set('begin', str(group.begins[row]))
+                element.set('end', str(group.ends[row]))
+            for attribute in group.dirty_attributes:
+                codes, values, _ = group.attributes[attribute]
+                for row in np.flatnonzero(group.alive):
+                    element = group.elements[row]
+                    if codes[row] >= 0:
+                        element.set(attribute, values[codes[row]])
+                    else:
+                        element.attrib.pop(attribute, None)
+
+            dead = np.flatnonzero(~group.alive)
+            uncounted = int((~group.alive & ~group.counted).sum())
+            if counts is not None and uncounted:
+                counts[tag] = counts.get(tag, 0) + uncounted
+            removed.update(group.elements[row] for row in dead)
+
+            keep = np.flatnonzero(group.alive)
+            group.elements = [group.elements[row] for row in keep]
+            group.has_coords = group.has_coords[keep]
+            group.begins = group.begins[keep]
+            group.ends = group.ends[keep]
+            group.alive = group.alive[keep]
+            group.counted = group.counted[keep]
+            for attribute, (codes, values, index) in list(
+                group.attributes.items()
+            ):
+                group.attributes[attribute] = (codes[keep], values, index)
+            group.saved_begins = group.begins.copy()
+            group.saved_ends = group.ends.copy()
+            group.dirty_attributes = set()
+
+        if removed:
+            root = self.tree.getroot()
+            set_children(
+                self.tree, [child for child in root if child not in removed]
+            )
+
+        return self.tree
@@ -0,0 +1,185 @@
+import sys
+
+
+class AnnotationView:
+    """Lightweight typed view of an annotation element.
+
+    Holds begin and end as ints, so they are parsed once instead of on
+    every comparison. The view can be used where an element (get, set,
+    tag) or a (begin, end) pair is expected. Views made by AnnotationViews
+    keep changed coordinates to themselves until AnnotationViews.sync
+    writes them to the element; other views write them right away.
+
+    Args:
+        element (Element object): annotation element to be viewed
+        changed (set): set the view adds itself to when its coordinates
+            change, instead of writing them to the element
+    """
+
+    __slots__ = ('element', 'tag', 'begin', 'end', '_changed')
+
+    def __init__(self, element, changed=None):
+        self.element = element
+        self.tag = element.tag
+        self._changed = changed
+        self.reload()
+
+    def __getitem__(self, index):
+        return (self.begin, self.end)[index]
+
+    def __iter__(self):
+        return iter((self.begin, self.end))
+
+    def __len__(self):
+        return 2
+
+    def __repr__(self):
+        return f'AnnotationView({self.tag}, {self.begin}, {self.end})'
+
+    @property
+    def attrib(self):
+        # The whole dict is asked for, so it has to be up to date
+        self.write_coords()
+        return self.element.attrib
+
+    def get(self, key, default=None):
+        if key == 'begin' and self.begin is not None:
+            return str(self.begin)
+        if key == 'end' and self.end is not None:
+            return str(self.end)
+        return self.element.get(key, default)
+
+    def set(self, key, value):
+        if key in ('begin', 'end'):
+            setattr(self, key, int(value))
+            if self._changed is None:
+                self.element.set(key, str(value))
+            else:
+                self._changed.add(self)
+        else:
+            self.element.set(key, sys.intern(value))
+
+    def write_coords(self):
+        """Writes changed coordinates to the element."""
+        if self._changed is None or self not in self._changed:
+            return
+        self._changed.discard(self)
+        self.element.set('begin', str(self.begin))
+        self.element.set('end', str(self.end))
+
+    def reload(self):
+        """Reads the coordinates from the element again, after it was
+        changed directly. Coordinates that are not ints are read as None.
+        """
+        if self._changed is not None:
+            self._changed.discard(self)
+        self.begin = _int_or_none(self.element.get('begin'))
+        self.end = _int_or_none(self.element.get('end'))
+
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def intern_attributes(element):
+    """Replaces the attribute values of an element with interned strings,
+    so that repeated labels share a single string object."""
+    for key, value in element.attrib.items():
+        interned = sys.intern(value)
+        if interned is not value:
+            element.set(key, interned)
+
+
+class AnnotationViews:
+    """Tree wrapper that hands out views of the annotations, created once
+    per element.
+
+    findall returns AnnotationViews instead of elements, so the functions
+    of element_editing and complex_operations work on the cached ints when
+    given the wrapper in place of the tree. Coordinate changes stay on the
+    views until sync writes them to the elements, which default_write and
+    write do before serialising. Code reading the wrapped tree directly
+    has to call sync first. Creating a view interns the attribute values
+    of its element.
+
+    Args:
+        tree (ElementTree object): tree whose annotations are viewed, can
+            be an IndexedTree
+        namespaces (dict): namespace dictionary the tree uses
+    """
+
+    def __init__(self, tree, namespaces):
+        self.tree = tree
+        self.namespaces = namespaces
+        self._views = {}
+        self._changed = set()
+
+    def view(self, element):
+        """Gets the view of an element."""
+        view = self._views.get(element)
+        if view is None:
+            intern_attributes(element)
+            view = AnnotationView(element, self._changed)
+            self._views[element] = view
+        return view
+
+    def viewed(self, element):
+        """Gets the view of an element if there is one, else the element
+        itself. Elements without a view have no pending changes."""
+        return self._views.get(element, element)
+
+    def forget(self, elements):
+        """Drops the views of elements removed from the tree."""
+        for element in elements:
+            view = self._views.pop(element_of(element), None)
+            if view is not None:
+                self._changed.discard(view)
+
+    def sync(self):
+        """Writes the changed coordinates of the views to their elements."""
+        for view in list(self._changed):
+            view.write_coords()
+
+    def getroot(self):
+        return self.tree.getroot()
+
+    def write(self, *args, **kwargs):
+        self.sync()
+        return self.tree.write(*args, **kwargs)
+
+    def iter(self, tag=None):
+        return self.tree.iter(tag)
+
+    def find(self, path, namespaces=None):
+        return self.tree.find(path, namespaces)
+
+    def findall(self, path, namespaces=None):
+        return [
+            self.view(element)
+            for element in self.tree.findall(path, namespaces)
+        ]
+
+
+def viewed(tree, element):
+    """Gets the view of an element if tree is an AnnotationViews with a
+    view of it, else the element."""
+    if isinstance(tree, AnnotationViews):
+        return tree.viewed(element)
+    return element
+
+
+def element_of(item):
+    """Gets the element of an AnnotationView, or the item itself."""
+    return item.element if isinstance(item, AnnotationView) else item
+
+
+def unwrap(tree):
+    """Gets the tree wrapped by an AnnotationViews after syncing it, or
+    the tree itself."""
+    if isinstance(tree, AnnotationViews):
+        tree.sync()
+        return tree.tree
+    return tree
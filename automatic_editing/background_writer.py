@@ -0,0 +1,200 @@
+import threading
+from . import xmi_handling as xh
+
+
+def _set_attributes(element, changes):
+    for attribute, value in changes.items():
+        if value is None:
+            element.attrib.pop(attribute, None)
+        else:
+            element.set(attribute, value)
+
+
+class BackgroundWriter:
+    """Writes a tree to its file and appends corrections to its journal
+    on a separate thread.
+
+    The writer thread serialises the caller's tree itself, without a copy.
+    Changes applied through the writer while a write is running are kept
+    as a list and applied once the write is done, so the caller never
+    waits for a write and the tree does not change under it. All writes
+    asked for while a write runs are coalesced into the next one. Journal
+    records are appended by the same thread, with one fsync per batch.
+    Every write is atomic, see xmi_handling.default_write.
+
+    The thread finishes what it was given before it stops, also when the
+    program ends without close, so no temporary file is left behind.
+
+    Args:
+        tree (ElementTree object): tree to be written
+        filepath (str): xmi file to be written
+        journal (EditJournal): journal the corrections are recorded in,
+            cleared after a write that includes all of them
+    """
+
+    def __init__(self, tree, filepath, journal=None):
+        self.filepath = filepath
+        self.journal = journal
+        self.submitted = 0
+        self.saved = 0
+        self.recorded = 0
+        self.synced = 0
+        self.error = None
+        self._tree = tree
+        self._deferred = []
+        self._records = []
+        self._writing = False
+        self._closing = False
+        self._condition = threading.Condition()
+        self._thread = None
+        self.start()
+
+    def start(self):
+        """Starts the writer thread, again after close."""
+        with self._condition:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._closing = False
+        self._thread = threading.Thread(target=self._run)
+        self._thread.start()
+
+    def _raise_error(self):
+        if self.error is not None:
+            raise self.error
+
+    def apply(self, element, changes):
+        """Applies attribute changes to an element of the tree, or keeps
+        them until the running write is done.
+
+        Args:
+            element (Element): element of the tree
+            changes (dict): new value per attribute, None to remove the
+                attribute
+
+        Raises:
+            Exception: the error that stopped the writer thread, if any
+        """
+        with self._condition:
+            self._raise_error()
+            if self._writing:
+                self._deferred.append((element, changes))
+            else:
+                _set_attributes(element, changes)
+
+    def get(self, element, attribute):
+        """Gets an attribute of an element, including changes that are
+        not applied yet."""
+        with self._condition:
+            for deferred, changes in reversed(self._deferred):
+                if deferred is element and attribute in changes:
+                    return changes[attribute]
+            return element.get(attribute)
+
+    def record(self, changes):
+        """Hands a correction over to be appended to the journal, see
+        EditJournal.record."""
+        with self._condition:
+            self._raise_error()
+            self._records.append(changes)
+            self.recorded += 1
+            self._condition.notify_all()
+
+    def submit(self, count=1):
+        """Asks for a write of the tree with all changes applied so far,
+        without waiting.
+
+        Args:
+            count (int): number of corrections the write saves, see saved
+
+        Raises:
+            Exception: the error that stopped the writer thread, if any
+        """
+        with self._condition:
+            self._raise_error()
+            self.submitted += count
+            self._condition.notify_all()
+
+    def settle(self):
+        """Waits for a running write, so that every change is applied to
+        the tree."""
+        with self._condition:
+            while self._writing:
+                self._condition.wait()
+
+    def _run(self):
+        main_thread = threading.main_thread()
+        while True:
+            with self._condition:
+                while not self._records and self.saved == self.submitted:
+                    if self._closing or not main_thread.is_alive():
+                        return
+                    self._condition.wait(0.5)
+                records, self._records = self._records, []
+                target = self.submitted
+                write = self._writing = self.saved != target
+                recorded = self.recorded
+
+            try:
+                if records:
+                    self.journal.record_batch(records)
+                    with self._condition:
+                        self.synced += len(records)
+                        self._condition.notify_all()
+                if write:
+                    xh.default_write(self._tree, self.filepath, fsync=True)
+            except Exception as error:  # Reported by the next call
+                with self._condition:
+                    self.error = error
+                    self._closing = True
+                    self._writing = False
+                    self._condition.notify_all()
+                return
+
+            if not write:
+                continue
+            with self._condition:
+                for element, changes in self._deferred:
+                    _set_attributes(element, changes)
+                self._deferred = []
+                self._writing = False
+                self.saved = target
+                # Corrections recorded since the write started are not
+                # necessarily in the file
+                clear = self.journal is not None and self.recorded == recorded
+                self._condition.notify_all()
+            if clear:
+                self.journal.clear()
+
+    def wait_recorded(self):
+        """Waits until every correction handed over is in the journal.
+
+        Raises:
+            Exception: the error that stopped the writer thread, if any
+        """
+        with self._condition:
+            while self.synced != self.recorded and self.error is None:
+                self._condition.wait()
+        self._raise_error()
+
+    def flush(self):
+        """Waits until everything handed over is written.
+
+        Raises:
+            Exception: the error that stopped the writer thread, if any
+        """
+        with self._condition:
+            while (
+                self.saved != self.submitted or self.synced != self.recorded
+            ) and self.error is None:
+                self._condition.wait()
+        self._raise_error()
+
+    def close(self):
+        """Writes what is left and stops the writer thread."""
+        try:
+            self.flush()
+        finally:
+            with self._condition:
+                self._closing = True
+                self._condition.notify_all()
+            self._thread.join()
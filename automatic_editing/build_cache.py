@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+from . import xmi_handling as xh
+from . import regexes
+from . import __version__
+
+
+_source_hash = None
+
+
+def source_hash():
+    """Gets a hash of the package's source files, so that cached results
+    are not reused after the code of a step changed. Computed once per
+    process."""
+    global _source_hash
+    if _source_hash is None:
+        digest = hashlib.sha256()
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith('.py'):
+                digest.update(filename.encode('utf-8') + b'\0')
+                with open(os.path.join(directory, filename), 'rb') as file_:
+                    digest.update(file_.read() + b'\0')
+        _source_hash = digest.hexdigest()
+    return _source_hash
+
+
+def _with_regex_values(value):
+    """Adds the patterns to the {"regex": NAME} values of a step
+    definition, see pipeline.load_config."""
+    if isinstance(value, dict):
+        if set(value) == {'regex'}:
+            return {
+                'regex': value['regex'],
+                'pattern': str(getattr(regexes, value['regex'], None))
+            }
+        return {key: _with_regex_values(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_with_regex_values(item) for item in value]
+    return value
+
+
+class BuildCache:
+    """Content-addressed cache of pipeline results.
+
+    Every step of a pipeline run gets a key hashed from the input file's
+    content, the definitions of the steps up to it with the patterns of
+    the regexes they name, the package's source code and the parsing
+    backend. The final output is always stored, intermediate
+    results only after steps marked with "cache": true in the definition
+    (e.g. the sofa_regex_replace passes or push_out_annotations). A run
+    starts from the latest stored step, so after changing a step only the
+    steps from there on are recomputed, and an unchanged file is simply
+    copied, compressed as its output path asks for. When the cache grows
+    beyond max_bytes, the least recently used entries are removed.
+
+    Args:
+        directory (str): directory the results are stored in
+        max_bytes (int): size cap of the cache, unlimited if None
+    """
+
+    def __init__(self, directory, max_bytes=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def step_keys(self, input_path, step_definitions):
+        """Gets the key of the result after each step for an input file."""
+        content = hashlib.sha256()
+        with open(input_path, 'rb') as file_:
+            for block in iter(lambda: file_.read(1 << 20), b''):
+                content.update(block)
+        base = '\0'.join((
+            __version__, source_hash(), xh.get_backend(), content.hexdigest()
+        ))
+        # Marking a step for caching does not change its result
+        step_definitions = [
+            {
+                key: _with_regex_values(value)
+                for key, value in step.items() if key != 'cache'
+            }
+            for step in step_definitions
+        ]
+
+        keys = []
+        for index in range(len(step_definitions)):
+            definition = json.dumps(
+                step_definitions[:index + 1], sort_keys=True
+            )
+            keys.append(hashlib.sha256(
+                (base + '\0' + definition).encode('utf-8')
+            ).hexdigest())
+        return keys
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.xmi')
+
+    def latest(self, keys):
+        """Gets the index and path of the latest step with a stored result,
+        None if there is none. A hit counts as a use for eviction."""
+        for index in range(len(keys) - 1, -1, -1):
+            path = self.path(keys[index])
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                continue
+            return index, path
+        return None
+
+    def store_tree(self, key, tree):
+        """Stores a tree as the result for a key."""
+        xh.default_write(tree, self.path(key))
+        self.evict()
+
+    def store_file(self, key, filepath):
+        """Stores a written xmi file as the result for a key. Results are
+        stored uncompressed, whatever the file is compressed with."""
+        # Temporary files start with a dot, so eviction leaves them alone
+        xh.copy_xmi(filepath, self.path(key))
+        self.evict()
+
+    def size(self):
+        """Gets the number of bytes of all stored results."""
+        return sum(size for _, size, _ in self._entries())
+
+    def _entries(self):
+        entries = []
+        for filename in os.listdir(self.directory):
+            if filename.startswith('.'):  # Still being written
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:  # Evicted by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self):
+        """Removes the least recently used results until the cache fits
+        max_bytes."""
+        if self.max_bytes is None:
+            return
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -1,3 +1,5 @@
+import bisect
+import itertools
 from . import element_editing as ed
 from . import xmi_handling as xh
 from . import sofa_editing as se
@@ -14,6 +16,9 @@ def add_metadata_tag(
         metadata_dict (dict): dictionary of metadata to be added
         tree (ElementTree object): tree to which the metadata should be added
         namespaces (dict): namespace dictionary the tree uses
+        position (int): index of the root child the first tag is inserted
+            before. If None, tags are appended, see
+            element_editing.canonical_order
 
     Returns:
         ElementTree object: tree with added metadata
@@ -31,7 +36,8 @@ def add_metadata_tag(
             metadata_dict,
             position
         )
-        position += 1  # Next element gets added after the last one
+        if position is not None:
+            position += 1  # Next element gets added after the last one
 
     return tree
 
@@ -42,6 +48,8 @@ def correct_sentences(tree, namespaces, sentence_begin=2):
     Args:
         tree (ElementTree object): tree to be corrected
         namespaces (dict): namespace dictionary the tree uses
+        sentence_begin (int): index of the root child new sentences are
+            inserted from. If None, they are appended
 
     Returns:
         ElementTree object: tree with corrected sentences
@@ -54,11 +62,11 @@ def correct_sentences(tree, namespaces, sentence_begin=2):
     sentences_to_add = []
 
     for index, metainfo in enumerate(metadata):
-        start = int(metainfo.get('begin'))
+        start = xcu.element_coords(metainfo)[0]
         for sentence in sentences:
-            if start == int(sentence.get('begin')):
+            if start == xcu.element_coords(sentence)[0]:
                 try:
-                    end = int(metadata[index+1].get('begin')) - 1
+                    end = xcu.element_coords(metadata[index+1])[0] - 1
                 except IndexError:
                     end = len(text) - 1
                 new_coords = xcu.narrow_coords((start, end), text)
@@ -67,7 +75,7 @@ def correct_sentences(tree, namespaces, sentence_begin=2):
                 break
         else:
             try:
-                end = int(metadata[index+1].get('begin')) - 1
+                end = xcu.element_coords(metadata[index+1])[0] - 1
             except IndexError:
                 end = len(text) - 1
             new_coords = xcu.narrow_coords((start, end), text)
@@ -79,12 +87,13 @@ def correct_sentences(tree, namespaces, sentence_begin=2):
                     'begin': str(start),
                     'end': str(end)
                 },
-                sentence_begin+index
+                None if sentence_begin is None else sentence_begin+index
             ))
 
-    for sentence in sentences:
-        if sentence not in used_sentences:
-            tree.getroot().remove(sentence)
+    ed.remove_elements(tree, [
+        sentence for sentence in sentences
+        if sentence not in used_sentences
+    ])
 
     for sentence in sentences_to_add:
         tree = ed.add_element(tree, *sentence)
@@ -92,8 +101,8 @@ def correct_sentences(tree, namespaces, sentence_begin=2):
     return tree
 
 
-def delete_keine_moral(tree, namespaces):
-    root = tree.getroot()
+def delete_keine_moral(tree, namespaces, counts=None, append=False):
+    to_delete = []
     moral_assocs = xcu.sentence_associations(
         'KAT1MoralisierendesSegment', tree, namespaces
     )
@@ -109,18 +118,19 @@ def delete_keine_moral(tree, namespaces):
         ]
 
         if len(nonmorals) > 0 and len(moralizations) == 0:
-            position = xh.get_position_before_element(
+            position = None if append else xh.get_position_before_element(
                 tree, nonmorals[0].tag, nonmorals[0].attrib
             )
-            new_element_dict = nonmorals[0].attrib.copy()
+            new_element_dict = dict(nonmorals[0].attrib)
             new_element_dict['begin'] = sentence.get('begin')
             new_element_dict['end'] = sentence.get('end')
             tree = ed.add_element(
                 tree, '{'+namespaces['custom']+'}Span',
                 new_element_dict, before=position
             )
-        for nonmoral in nonmorals:
-            root.remove(nonmoral)
+        to_delete.extend(nonmorals)
+
+    ed.remove_elements(tree, to_delete, counts)
 
     return tree
 
@@ -137,7 +147,7 @@ def include_punctuation(tree, namespaces):
             sentence_wide_annos.append(annotation)
 
     for annotation in sentence_wide_annos:
-        annotation_end = int(annotation.get('end'))
+        annotation_end = xcu.element_coords(annotation)[1]
         while text[annotation_end] not in whitespace:
             annotation_end += 1
         annotation.set('end', str(annotation_end))
@@ -150,31 +160,207 @@ def element_is_moralization(element):
     return attempt == 'Moralisierung'
 
 
-def remove_double_moralizations(tree, namespaces):
-    annotations = [
-        span for span in tree.findall('custom:Span', namespaces)
-        if span.get('KAT1MoralisierendesSegment')
+def generic_moralization_loses(duplicates, category):
+    """Resolution policy: the generic "Moralisierung" label loses against
+    any span with a more specific (or different) label."""
+    non_generic = [
+        duplicate for duplicate in duplicates
+        if not element_is_moralization(duplicate)
+    ]
+    if not non_generic:
+        return []
+    return [
+        duplicate for duplicate in duplicates
+        if element_is_moralization(duplicate)
     ]
-    root = tree.getroot()
-    span_set = set()
-    for annotation in annotations:
-        coords = tuple(xcu.get_coords(annotation))
-        if coords in span_set:
-            duplicates = [
-                span for span in tree.findall('custom:Span', namespaces)
-                if span.get('begin') == str(coords[0])
-                and span.get('end') == str(coords[1])
-            ]
-            non_generic = [
-                duplicate for duplicate in duplicates
-                if not element_is_moralization(duplicate)
-            ]
-            for duplicate in duplicates:
-                if (
-                    element_is_moralization(duplicate)
-                    and len(non_generic) > 0
-                ):
-                    root.remove(duplicate)
-        span_set.add(coords)
+
+
+def exact_duplicates_lose(duplicates, category):
+    """Resolution policy: a span with the category loses if an earlier span
+    carries exactly the same labels."""
+    seen = set()
+    losers = []
+    for duplicate in duplicates:
+        if not duplicate.get(category):
+            continue
+        labels = frozenset(
+            (key, value) for key, value in duplicate.attrib.items()
+            if not key.endswith('}id')
+        )
+        if labels in seen:
+            losers.append(duplicate)
+        seen.add(labels)
+    return losers
+
+
+def remove_duplicate_spans(
+    tree, namespaces, category, policy=exact_duplicates_lose, counts=None
+):
+    """Resolves spans of a category that share the same coordinates.
+
+    All spans are grouped by their (begin, end) in one pass. Every group
+    containing more than one span of the category is handed to the policy,
+    together with the other spans at the same coordinates.
+
+    Args:
+        tree (ElementTree object): tree whose spans are deduplicated
+        namespaces (dict): namespace dictionary the tree uses
+        category (str): attribute whose duplicate spans are resolved
+        policy (callable): gets the list of spans at the same coordinates
+            and the category, returns the spans to be removed
+        counts (dict): if given, the number of removed spans is added
+            under the span tag, see element_editing.remove_elements
+
+    Returns:
+        ElementTree object: tree with resolved duplicates
+    """
+
+    losers = duplicate_losers(
+        tree.findall('custom:Span', namespaces), category, policy
+    )
+    ed.remove_elements(tree, losers, counts)
+
+    return tree
+
+
+def duplicate_losers(spans, category, policy, key=None):
+    """Gets the spans the policy removes from every group of spans sharing
+    the same coordinates, see remove_duplicate_spans.
+
+    Args:
+        spans (list): spans in document order
+        category (str): attribute whose duplicate spans are resolved
+        policy (callable): see remove_duplicate_spans
+        key (list): coordinates to group the spans by, one per span.
+            Defaults to their begin and end attributes
+
+    Returns:
+        list: spans to be removed
+    """
+
+    if key is None:
+        key = [(span.get('begin'), span.get('end')) for span in spans]
+
+    groups = {}
+    for span, coords in zip(spans, key):
+        groups.setdefault(coords, []).append(span)
+
+    losers = []
+    for duplicates in groups.values():
+        if sum(1 for span in duplicates if span.get(category)) < 2:
+            continue
+        losers.extend(policy(duplicates, category))
+
+    return losers
+
+
+def remove_double_moralizations(tree, namespaces, counts=None):
+    return remove_duplicate_spans(
+        tree, namespaces, 'KAT1MoralisierendesSegment',
+        policy=generic_moralization_loses, counts=counts
+    )
+
+
+def cleanup_annotations(tree, namespaces, counts=None):
+    """Runs the cleanup steps in one go over the parsed offsets.
+
+    The result is the same as calling narrow_all_tag_cords for spans,
+    include_punctuation, remove_double_moralizations, delete_empty_tags,
+    delete_whitespace_tokens, delete_overlap_tokens and
+    delete_outside_sentence in this order. Offsets are parsed once, every
+    deletion is decided on the ints and the elements are removed from the
+    root in a single pass at the end.
+
+    Args:
+        tree (ElementTree object): tree to be cleaned up
+        namespaces (dict): namespace dictionary the tree uses
+        counts (dict): if given, the number of removed elements is added
+            per tag, see element_editing.remove_elements
+
+    Returns:
+        ElementTree object: cleaned up tree
+    """
+
+    text = xh.get_sofa_string(tree, namespaces)
+    whitespace = ' \n\t'
+    to_delete = []
+
+    def is_empty(coords):
+        return coords[0] >= coords[1] or coords[0] < 0 or coords[1] < 0
+
+    # Narrow spans and include punctuation of sentence-wide spans
+    spans = tree.findall('custom:Span', namespaces)
+    span_coords = []
+    for span in spans:
+        if span.get('begin') is None or span.get('end') is None:
+            span_coords.append(None)
+            continue
+        begin, end = xcu.narrow_coords(xcu.element_coords(span), text)
+        if (
+            span.get('KAT1MoralisierendesSegment')
+            or span.get('KommunikativeFunktion')
+        ):
+            while text[end] not in whitespace:
+                end += 1
+        span.set('begin', str(begin))
+        span.set('end', str(end))
+        span_coords.append((begin, end))
+
+    losers = set(duplicate_losers(
+        spans, 'KAT1MoralisierendesSegment', generic_moralization_loses,
+        key=span_coords
+    ))
+    to_delete.extend(losers)
+
+    def kept(elements, coords_list=None):
+        if coords_list is None:
+            coords_list = [xcu.element_coords(element) for element in elements]
+        pairs = []
+        for element, coords in zip(elements, coords_list):
+            if element in losers:
+                continue
+            if coords is None:
+                coords = xcu.element_coords(element)
+            if is_empty(coords):
+                to_delete.append(element)
+            else:
+                pairs.append((element, coords))
+        return pairs
+
+    spans = kept(spans, span_coords)
+    metadata = kept(tree.findall('custom:Metadata', namespaces))
+    sentences = kept(tree.findall('type5:Sentence', namespaces))
+    tokens = kept(tree.findall('type5:Token', namespaces))
+
+    # Whitespace tokens, then short tokens covered by the remaining ones
+    remaining = []
+    for token, (begin, end) in tokens:
+        if text[begin:end] == ' ':
+            to_delete.append(token)
+        else:
+            remaining.append((token, (begin, end)))
+    covered = set(ed.covered_short_tokens([
+        coords for _, coords in remaining
+    ]))
+    tokens = []
+    for index, pair in enumerate(remaining):
+        if index in covered:
+            to_delete.append(pair[0])
+        else:
+            tokens.append(pair)
+
+    # Anything not inside a sentence, using the running maximum of the
+    # sentence ends sorted by begin
+    sentence_coords = sorted(coords for _, coords in sentences)
+    begins = [begin for begin, _ in sentence_coords]
+    reach = list(itertools.accumulate(
+        (end for _, end in sentence_coords), max
+    ))
+    for element, (begin, end) in spans + metadata + tokens:
+        index = bisect.bisect_right(begins, begin)
+        if index == 0 or reach[index - 1] < end:
+            to_delete.append(element)
+
+    ed.remove_elements(tree, to_delete, counts)
 
     return tree
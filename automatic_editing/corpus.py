@@ -0,0 +1,163 @@
+import os
+import time
+import traceback
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from . import xmi_handling as xh
+from . import pipeline
+
+
+FileResult = namedtuple(
+    'FileResult', ['input_path', 'output_path', 'seconds', 'reports', 'error']
+)
+
+
+def find_xmi_files(directory):
+    """Gets the paths of all .xmi files in a directory tree, sorted."""
+    paths = []
+    for dirpath, _, filenames in os.walk(directory):
+        paths.extend(
+            os.path.join(dirpath, filename) for filename in filenames
+            if xh.xmi_filename_extension(filename, raise_err=False)
+        )
+    return sorted(paths)
+
+
+def process_file(config, input_path, output_path, backend=None, cache=None):
+    """Runs a pipeline over one file, catching any error.
+
+    Namespace prefixes registered while the file is processed are undone
+    afterwards, so files handled by the same worker do not affect each
+    other's output.
+
+    Returns:
+        FileResult: step reports, or the formatted traceback as error
+    """
+
+    started = time.perf_counter()
+    try:
+        if backend is not None:
+            xh.set_backend(backend)
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        with xh.isolated_namespaces():
+            reports = pipeline.run_pipeline_file(
+                config, input_path, output_path, cache=cache
+            )
+        error = None
+    except Exception:
+        reports = []
+        error = traceback.format_exc()
+
+    return FileResult(
+        input_path, output_path, time.perf_counter() - started,
+        reports, error
+    )
+
+
+def _run_in_pool(paths, workers, run, results):
+    """Runs run(path) for the paths in a process pool and stores the
+    results. Gets the paths whose futures failed because a worker process
+    died, which breaks the whole pool."""
+    broken = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(*run(path)): path for path in paths}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except BrokenProcessPool:
+                broken.append(futures[future])
+                continue
+            results[result.input_path] = result
+    return broken
+
+
+def run_corpus(
+    config, input_dir, output_dir, workers=None, backend=None, cache=None
+):
+    """Runs a pipeline over every .xmi file in a directory tree.
+
+    Files are spread over a process pool, largest first, so that a big
+    file does not start last and hold up the end of the run. A file that
+    fails is reported and does not stop the others. Outputs keep their
+    path relative to input_dir.
+
+    A worker process that dies, e.g. killed for running out of memory,
+    breaks the pool and every file still in it. Those files are run again,
+    each in a pool of its own, so that only the file killing its worker
+    is reported as failed.
+
+    Args:
+        config (dict or str): pipeline definition or path of its file
+        input_dir (str): directory searched for .xmi files
+        output_dir (str): directory the edited files are written to
+        workers (int): number of processes, os.cpu_count() if not given.
+            With 1, files are processed in this process
+        backend (str): parsing backend for the workers, see
+            xmi_handling.set_backend. The current one if not given
+        cache (BuildCache): cache shared by the workers, see
+            build_cache.BuildCache
+
+    Returns:
+        list: FileResult per file, in the order of find_xmi_files
+    """
+
+    if isinstance(config, str):
+        config = pipeline.load_config(config)
+    pipeline.resolve_steps(config)  # Fail early on unknown steps
+    if backend is None:
+        backend = xh.get_backend()
+
+    inputs = find_xmi_files(input_dir)
+    jobs = {
+        path: os.path.join(output_dir, os.path.relpath(path, input_dir))
+        for path in inputs
+    }
+    order = sorted(inputs, key=os.path.getsize, reverse=True)
+
+    if workers == 1:
+        results = {
+            path: process_file(config, path, jobs[path], backend, cache)
+            for path in order
+        }
+    else:
+        def run(path):
+            return process_file, config, path, jobs[path], backend, cache
+
+        results = {}
+        broken = _run_in_pool(order, workers, run, results)
+        for path in broken:
+            started = time.perf_counter()
+            if _run_in_pool([path], 1, run, results):
+                results[path] = FileResult(
+                    path, jobs[path], time.perf_counter() - started, [],
+                    'The worker process processing the file died.'
+                )
+
+    return [results[path] for path in inputs]
+
+
+def format_summary(results):
+    """Formats the results of a corpus run: failed files with their error,
+    counts and the time spent per step over all files."""
+
+    failed = [result for result in results if result.error is not None]
+    step_seconds = {}
+    for result in results:
+        for report in result.reports:
+            key = (report.index, report.name)
+            step_seconds[key] = step_seconds.get(key, 0) + report.seconds
+
+    lines = []
+    for result in failed:
+        lines.append(f'FAILED {result.input_path}')
+        lines.append(result.error.rstrip())
+    lines.append(
+        f'{len(results) - len(failed)} of {len(results)} files done, '
+        f'{len(failed)} failed, '
+        f'{sum(result.seconds for result in results):.3f}s in total'
+    )
+    for (index, name), seconds in sorted(step_seconds.items()):
+        lines.append(f'{index:02d} {name:<29} {seconds:>9.3f}')
+
+    return '\n'.join(lines)
@@ -0,0 +1,109 @@
+import json
+import os
+
+
+class EditJournal:
+    """Append-only journal of attribute changes made to an xmi file.
+
+    Every recorded correction is one line of JSON holding, per changed
+    attribute, the position and tag of the root child, the attribute and
+    its old and new value (None when absent). Lines are flushed and
+    fsync'd as they are written, so a correction survives a crash without
+    writing the whole document. Once the document has been written, the
+    journal is cleared.
+
+    Args:
+        path (str): path of the journal file, usually the xmi path plus
+            '.journal'
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def record(self, changes):
+        """Appends one correction and forces it to disk.
+
+        Args:
+            changes (list): (position, tag, attribute, old, new) tuples
+        """
+        self.record_batch([changes])
+
+    def record_batch(self, corrections):
+        """Appends several corrections, see record, with a single fsync."""
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        for changes in corrections:
+            self._file.write(json.dumps([list(change) for change in changes]))
+            self._file.write('\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def entries(self):
+        """Gets the recorded corrections. A last line cut off by a crash
+        is ignored."""
+        if not os.path.exists(self.path):
+            return []
+        corrections = []
+        with open(self.path, encoding='utf-8') as file_:
+            for line in file_:
+                try:
+                    corrections.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break
+        return corrections
+
+    def replay(self, tree):
+        """Applies the recorded corrections to a tree read from the file
+        the journal belongs to.
+
+        Replaying is idempotent, so it does no harm if the corrections
+        already made it into the file before the journal was cleared. An
+        attribute has to hold the value recorded before or after the
+        change, or the value after a later change of it.
+
+        Returns:
+            int: number of corrections replayed
+
+        Raises:
+            ValueError: if the journal does not fit the tree
+        """
+        root = tree.getroot()
+        corrections = self.entries()
+        changes = [change for changes in corrections for change in changes]
+
+        # Values an attribute may hold when its change is replayed
+        allowed = [None] * len(changes)
+        later = {}
+        for index in range(len(changes) - 1, -1, -1):
+            position, _, attribute, old, new = changes[index]
+            values = later.setdefault((position, attribute), set())
+            values.add(new)
+            allowed[index] = values | {old}
+
+        for (position, tag, attribute, _, new), values in zip(
+            changes, allowed
+        ):
+            if (
+                position >= len(root) or root[position].tag != tag
+                or root[position].get(attribute) not in values
+            ):
+                raise ValueError(
+                    f'Journal {self.path} does not match the document.'
+                )
+            if new is None:
+                root[position].attrib.pop(attribute, None)
+            else:
+                root[position].set(attribute, new)
+        return len(corrections)
+
+    def clear(self):
+        """Removes the journal once its corrections are written."""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
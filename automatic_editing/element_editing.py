@@ -1,6 +1,10 @@
-import xml.etree.ElementTree as ET
+import bisect
+import itertools
 from . import xmi_conversion_util as xcu
 from . import xmi_handling as xh
+from .annotation_store import AnnotationStore
+from .annotation_view import AnnotationViews, element_of, viewed
+from .indexed_tree import insert_child, set_children
 
 
 def rename_attribute(tree, old_attribute_name, new_attribute_name):
@@ -77,6 +81,7 @@ def change_begin_end(tree, attribute_id, new_begin, new_end):
             'id' in element.attrib
             and element.get('id') == attribute_id
         ):
+            element = viewed(tree, element)
             element.set('begin', str(new_begin))
             element.set('end', str(new_end))
 
@@ -105,6 +110,17 @@ def remove_attribute(tree, attribute_name):
     return tree
 
 
+def make_element(tree, element_name, attributes):
+    """Creates a detached element formatted like the rest of the tree.
+
+    The element is made by the tree's root, so it belongs to the same
+    backend (ElementTree or lxml) as the tree.
+    """
+    new_element = tree.getroot().makeelement(element_name, attributes)
+    new_element.tail = '\n    '
+    return new_element
+
+
 def add_element(tree, element_name, attributes, before=None):
     """Adds an element to the tree.
 
@@ -118,13 +134,94 @@ def add_element(tree, element_name, attributes, before=None):
         ElementTree object: tree with the added element
     """
 
+    new_element = make_element(tree, element_name, attributes)
+    insert_child(tree, before, new_element)
+
+    return tree
+
+
+def remove_elements(tree, elements, counts=None):
+    """Removes many children of the root at once.
+
+    Instead of a linear root.remove per element, the root children are
+    rebuilt in a single pass without the marked elements.
+
+    Args:
+        tree (ElementTree object): tree whose root children are removed
+        elements (iterable): root children (or their views)
+            to be removed
+        counts (dict): dictionary the number of removed elements per tag
+            is added to. A new one is created if not given
+
+    Returns:
+        dict: number of removed elements per tag
+    """
+
+    if counts is None:
+        counts = {}
+    marked = {element_of(element) for element in elements}
+    if not marked:
+        return counts
+    if isinstance(tree, AnnotationViews):
+        tree.forget(marked)
+
     root = tree.getroot()
-    new_element = ET.Element(element_name, attributes)
-    new_element.tail = '\n    '
-    if before is None:
-        root.append(new_element)
-    else:
-        root.insert(before, new_element)
+    kept = []
+    for child in root:
+        if child in marked:
+            counts[child.tag] = counts.get(child.tag, 0) + 1
+        else:
+            kept.append(child)
+    set_children(tree, kept)
+
+    return counts
+
+
+def canonical_order(tree, namespaces, type_order=None):
+    """Sorts the root children into a canonical order with a single sort.
+
+    Children are grouped by tag, in the order the tags first appear in the
+    document. Tags listed in type_order are grouped together in the given
+    order, where the first of them appears. Within a tag, children are
+    sorted by begin, then end. This lets new elements simply be appended
+    instead of inserted at a computed position.
+
+    Args:
+        tree (ElementTree object): tree whose root children are sorted
+        namespaces (dict): namespace dictionary the tree uses
+        type_order (list): tags like 'custom:Metadata' to be kept in
+            this order relative to each other
+
+    Returns:
+        ElementTree object: tree with sorted root children
+    """
+
+    root = tree.getroot()
+    grouped = [xh.qualified_tag(tag, namespaces) for tag in type_order or []]
+
+    ranks = {}
+    for child in root:
+        if child.tag in ranks:
+            continue
+        if child.tag in grouped:
+            for tag in grouped:
+                ranks.setdefault(tag, len(ranks))
+        else:
+            ranks[child.tag] = len(ranks)
+
+    def sort_key(child):
+        try:
+            return (ranks[child.tag], 1) + xcu.element_coords(
+                viewed(tree, child)
+            )
+        except (TypeError, ValueError):
+            return (ranks[child.tag], 0, 0, 0)
+
+    tails = [child.tail for child in root]
+    children = sorted(root, key=sort_key)
+    for child, tail in zip(children, tails):
+        child.tail = tail
+    set_children(tree, children)
 
     return tree
 
@@ -173,143 +270,277 @@ def is_inside_coords(coords, possible_inside):
     return inside
 
 
+def push_out_coords(coords, bouncers, text, reach=None):
+    """Pushes a single annotation's coordinates out of all bouncers.
+
+    Bouncers are checked in order of their begin, in passes like repeated
+    push_out_annotations calls did, until a pass changes nothing. A part
+    split off a wrapped bouncer is checked from the first bouncer again.
+
+    Args:
+        coords (list): begin and end of the annotation
+        bouncers (list): (begin, end) tuples of the bouncers, stably
+            sorted by begin
+        text (str): sofaString used to narrow pushed out coordinates
+        reach (list): running maximum of the bouncer ends, computed
+            from bouncers if not given
+
+    Returns:
+        list: coordinates of the annotation parts left, in text order.
+            Empty if the annotation lies inside a bouncer, several parts
+            if it was split by bouncers it wrapped around
+    """
+
+    if reach is None:
+        reach = list(itertools.accumulate(
+            (bouncer[1] for bouncer in bouncers), max
+        ))
+    parts = _push_out_parts(coords, bouncers, text, reach)
+    return [part for part in parts if part is not None]
+
+
+def _push_out_parts(coords, bouncers, text, reach):
+    """Does the work of push_out_coords. The first part is the one the
+    annotation itself keeps, None if it was removed."""
+
+    parts = []
+    pending = [list(coords)]
+
+    while pending:
+        coords = pending.pop(0)
+        changed = True
+
+        while changed:
+            changed = False
+            # Begins only grow, bouncers ending before stay out of reach
+            index = bisect.bisect_left(reach, coords[0])
+
+            while index < len(bouncers) and bouncers[index][0] <= max(coords):
+                bouncer_range = bouncers[index]
+                inside = is_inside_coords(bouncer_range, coords)
+                old_coords = coords[:]
+                index += 1
+
+                if inside is False or not any(inside):
+                    continue
+
+                if inside[2]:
+                    pending.append([bouncer_range[1], coords[1]])
+                    coords[1] = bouncer_range[0] - 1
+                elif inside[0] and inside[1]:
+                    coords = None
+                    break
+                elif inside[0]:
+                    coords[0] = xcu.narrow_coords(
+                        (bouncer_range[1], coords[1]), text
+                    )[0]
+                else:
+                    coords[1] = xcu.narrow_coords(
+                        (coords[0], bouncer_range[0] - 1), text
+                    )[1]
+
+                if coords != old_coords:
+                    changed = True
+
+            if coords is None:
+                break
+
+        if coords is not None or not parts:
+            parts.append(coords)
+
+    return parts
+
+
 def push_out_annotations(tree, namespaces, bouncer_tag, annotation_tags):
+    """Pushes annotations out of the range of bouncer elements.
 
-    # We need all of this later
-    bouncers = tree.findall(bouncer_tag, namespaces)
-    annotations = []
-    for tag in annotation_tags:
-        annotations.extend(tree.findall(tag, namespaces))
+    Annotations reaching into a bouncer get narrowed to the outside,
+    annotations inside a bouncer get removed and annotations wrapping
+    around a bouncer get split in two. The split-off part is placed right
+    after the annotation. One call reaches the state that repeated calls
+    converge to.
+
+    Args:
+        tree (ElementTree object): tree whose annotations are pushed out
+        namespaces (dict): namespace dictionary the tree uses
+        bouncer_tag (str or list): tag(s) of the elements to push out of
+        annotation_tags (list): tags of the annotations to be pushed out
+
+    Returns:
+        ElementTree object: tree with pushed out annotations
+    """
+
+    if isinstance(bouncer_tag, str):
+        bouncer_tag = [bouncer_tag]
+
+    # Stable sort by begin only: bouncers with the same begin are checked
+    # in document order, like repeated calls did
+    bouncer_tags = {xh.qualified_tag(tag, namespaces) for tag in bouncer_tag}
+    bouncers = sorted(
+        (
+            xcu.element_coords(viewed(tree, child))
+            for child in tree.getroot()
+            if child.tag in bouncer_tags
+        ),
+        key=lambda coords: coords[0]
+    )
+    reach = list(itertools.accumulate(
+        (bouncer[1] for bouncer in bouncers), max
+    ))
     text = xh.get_sofa_string(tree, namespaces)
     root = tree.getroot()
 
-    # Sort annotations by begin attribute
-    annotations.sort(key=lambda x: int(x.get('begin')))
-    bouncers.sort(key=lambda x: int(x.get('begin')))
-
-    for bouncer in bouncers:
-        bouncer_range = (int(bouncer.get('begin')), int(bouncer.get('end')))
-        for annotation in annotations:
-            annotation_range = [
-                int(annotation.get('begin')), int(annotation.get('end'))
-            ]
-            inside = is_inside_coords(bouncer_range, annotation_range)
-
-            # We don't need to check the rest of the annotations
-            # if the annotations come after the bouncer (they are sorted)
-            if inside is False:
-                break
+    removed = set()
+    split_parts = {}
 
-            # If the annotation wraps arround the bouncer, we must split it
-            if inside[2]:
-                tag = annotation.tag
-                attrib = annotation.attrib.copy()
-                position = xh.get_position_before_element(
-                    tree, tag, attrib
-                )
-                attrib['begin'] = str(bouncer_range[1])
-                tree = add_element(
-                    tree, tag, attrib, position+1
-                )
-                annotation.set('end', str(bouncer_range[0] - 1))
-
-            # Push the annotations out of bouncer range where possible
-            if inside[0] and inside[1]:
-                root.remove(annotation)
-            if inside[0] and not inside[1]:
-                annotation_range[0] = bouncer_range[1]
-                new_coords = xcu.narrow_coords(annotation_range, text)
-                annotation.set('begin', str(new_coords[0]))
-            if inside[1] and not inside[0]:
-                annotation_range[1] = bouncer_range[0] - 1
-                new_coords = xcu.narrow_coords(annotation_range, text)
-                annotation.set('end', str(new_coords[1]))
+    for tag in annotation_tags:
+        for annotation in tree.findall(tag, namespaces):
+            coords = list(xcu.element_coords(annotation))
+            parts = _push_out_parts(coords, bouncers, text, reach)
+            if parts[0] is None:
+                # Parts split off before are kept as new elements
+                removed.add(element_of(annotation))
+            elif parts[0] != coords:
+                annotation.set('begin', str(parts[0][0]))
+                annotation.set('end', str(parts[0][1]))
+            if len(parts) > 1:
+                split_parts[element_of(annotation)] = []
+                for begin, end in parts[1:]:
+                    attrib = dict(annotation.attrib)
+                    attrib['begin'] = str(begin)
+                    attrib['end'] = str(end)
+                    split_parts[element_of(annotation)].append(
+                        make_element(tree, annotation.tag, attrib)
+                    )
+
+    if isinstance(tree, AnnotationViews):
+        tree.forget(removed)
+    if removed or split_parts:
+        children = []
+        for child in root:
+            if child not in removed:
+                children.append(child)
+            children.extend(split_parts.get(child, ()))
+        set_children(tree, children)
 
     return tree
 
 
 def narrow_all_tag_cords(tag, tree, namespaces):
+    if isinstance(tree, AnnotationStore):
+        tree.narrow(xh.get_sofa_string(tree.tree, namespaces), [tag])
+        return tree
+
     text = xh.get_sofa_string(tree, namespaces)
-    root = tree.getroot()
 
-    for element in root.findall(tag, namespaces):
-        if 'begin' in element.attrib and 'end' in element.attrib:
-            begin = int(element.get('begin'))
-            end = int(element.get('end'))
-            new_coords = xcu.narrow_coords((begin, end), text)
+    for element in tree.findall(tag, namespaces):
+        if (
+            element.get('begin') is not None
+            and element.get('end') is not None
+        ):
+            new_coords = xcu.narrow_coords(xcu.element_coords(element), text)
             element.set('begin', str(new_coords[0]))
             element.set('end', str(new_coords[1]))
 
     return tree
 
 
-def delete_empty_tags(tree, namespaces):
+def delete_empty_tags(tree, namespaces, counts=None):
+    if isinstance(tree, AnnotationStore):
+        tree.delete_empty([
+            'custom:Span', 'custom:Metadata', 'type5:Sentence', 'type5:Token'
+        ], counts)
+        return tree
+
     tag_list = tree.findall('custom:Span', namespaces)
     tag_list += tree.findall('custom:Metadata', namespaces)
     tag_list += tree.findall('type5:Sentence', namespaces)
     tag_list += tree.findall('type5:Token', namespaces)
 
-    root = tree.getroot()
+    to_delete = []
 
     for element in tag_list:
         try:
-            if (
-                int(element.get('begin')) >= int(element.get('end'))
-                or int(element.get('begin')) < 0
-                or int(element.get('end')) < 0
-            ):
+            begin, end = xcu.element_coords(element)
+            if begin >= end or begin < 0 or end < 0:
                 # print(element.tag, element.get('begin'), element.get('end'))
-                root.remove(element)
+                to_delete.append(element)
         except ValueError:
             pass
 
+    remove_elements(tree, to_delete, counts)
+
     return tree
 
 
-def delete_overlap_tokens(tree, namespaces):
-    token_list = tree.findall('type5:Token', namespaces)
-    to_delete = set()
-    root = tree.getroot()
+def delete_overlap_tokens(tree, namespaces, counts=None):
+    """Deletes short tokens (at most 2 chars) covered by another token.
+
+    Tokens are sorted by begin and descending end, so every token is
+    covered by another one exactly when an earlier token reaches at least
+    as far, or when another token has the identical range.
+
+    Args:
+        tree (ElementTree object): tree whose tokens are checked
+        namespaces (dict): namespace dictionary the tree uses
+        counts (dict): if given, the number of deleted tokens is added
+            under the token tag, see remove_elements
 
-    for i, token in enumerate(token_list):
-        token_range = (int(token.get('begin')), int(token.get('end')))
-        if token_range[1] - token_range[0] <= 2:
-            for prev_token in token_list[:i]+token_list[i+1:]:
-                if (
-                        int(prev_token.get('end')) >= token_range[1]
-                        and int(prev_token.get('begin')) <= token_range[0]
-                ):
-                    to_delete.add(token)
+    Returns:
+        ElementTree object: tree without the covered short tokens
+    """
 
-    for token in to_delete:
-        root.remove(token)
+    token_list = tree.findall('type5:Token', namespaces)
+    to_delete = [
+        token_list[index] for index in covered_short_tokens(
+            [xcu.element_coords(token) for token in token_list]
+        )
+    ]
+
+    remove_elements(tree, to_delete, counts)
 
     return tree
 
 
-def delete_outside_sentence(tree, namespaces):
+def covered_short_tokens(token_coords):
+    """Gets the indices of the (begin, end) pairs of at most 2 chars that
+    are covered by another pair, see delete_overlap_tokens."""
+
+    tokens = sorted(
+        (begin, -end, i) for i, (begin, end) in enumerate(token_coords)
+    )
+
+    covered = []
+    reach = None
+    for i, (begin, neg_end, index) in enumerate(tokens):
+        end = -neg_end
+        if end - begin <= 2 and (
+            (reach is not None and reach >= end)
+            or (i + 1 < len(tokens) and tokens[i + 1][:2] == (begin, neg_end))
+        ):
+            covered.append(index)
+        if reach is None or end > reach:
+            reach = end
+
+    return covered
+
+
+def delete_outside_sentence(tree, namespaces, counts=None):
     tag_list = tree.findall('custom:Span', namespaces)
     tag_list += tree.findall('custom:Metadata', namespaces)
     tag_list += tree.findall('type5:Token', namespaces)
-    sentences = tree.findall('type5:Sentence', namespaces)
+    sentences = xcu.IntervalIndex(tree.findall('type5:Sentence', namespaces))
 
-    root = tree.getroot()
+    to_delete = []
 
     for tag in tag_list:
 
-        inside = False
+        inside = sentences.first_containing(xcu.element_coords(tag))
 
-        for sentence in sentences:
-            if (
-                int(tag.get('begin')) >= int(sentence.get('begin'))
-                and int(tag.get('end')) <= int(sentence.get('end'))
-            ):
-                inside = True
-                break
+        if inside is None:
+            to_delete.append(tag)
 
-        if not inside:
-            print(tag.tag, tag.get('begin'), tag.get('end'))
-            root.remove(tag)
+    remove_elements(tree, to_delete, counts)
 
     return tree
 
@@ -324,16 +555,15 @@ def delete_group_annotation(tree, namespaces):
     return tree
 
 
-def delete_whitespace_tokens(tree, namespaces):
+def delete_whitespace_tokens(tree, namespaces, counts=None):
     tokens = tree.findall('type5:Token', namespaces)
-    root = tree.getroot()
     sofa_string = xh.get_sofa_string(tree, namespaces)
 
-    for token in tokens:
-        if sofa_string[
-            int(token.get('begin')):
-            int(token.get('end'))
-        ] == ' ':
-            root.remove(token)
+    to_delete = [
+        token for token in tokens
+        if xcu.get_span(sofa_string, xcu.element_coords(token)) == ' '
+    ]
+
+    remove_elements(tree, to_delete, counts)
 
     return tree
@@ -0,0 +1,255 @@
+import re
+from .annotation_view import AnnotationViews
+
+
+_SIMPLE_TAG = re.compile(r'^(\{[^}]*\})?[\w.-]+(:[\w.-]+)?$')
+
+BLOCK_SIZE = 256
+
+
+class _Block:
+    __slots__ = ('children', 'index')
+
+    def __init__(self, children):
+        self.children = children
+        self.index = 0
+
+
+class _PositionIndex:
+    """Positions of the root children, kept up to date on inserts.
+
+    The children are held in blocks of up to 2 * BLOCK_SIZE, with the
+    offset of every child inside its block and a Fenwick tree over the
+    block sizes. A position is the size of the blocks before plus the
+    offset, found in logarithmic time. An insert only renumbers the rest
+    of its block; a block growing too large is split, which renumbers the
+    blocks.
+    """
+
+    def __init__(self, children):
+        children = list(children)
+        self._block_of = {}
+        self._offsets = {}
+        self._size = len(children)
+        self._blocks = [
+            _Block(children[start:start + BLOCK_SIZE])
+            for start in range(0, len(children), BLOCK_SIZE)
+        ] or [_Block([])]
+        for block in self._blocks:
+            self._fill(block, 0)
+        self._build_sums()
+
+    def __len__(self):
+        return self._size
+
+    def _fill(self, block, start):
+        for offset in range(start, len(block.children)):
+            child = block.children[offset]
+            self._block_of[child] = block
+            self._offsets[child] = offset
+
+    def _build_sums(self):
+        sums = [0] * (len(self._blocks) + 1)
+        for index, block in enumerate(self._blocks):
+            block.index = index
+            node = index + 1
+            sums[node] += len(block.children)
+            parent = node + (node & -node)
+            if parent < len(sums):
+                sums[parent] += sums[node]
+        self._sums = sums
+
+    def _add(self, index, delta):
+        node = index + 1
+        while node < len(self._sums):
+            self._sums[node] += delta
+            node += node & -node
+
+    def _before(self, index):
+        total = 0
+        while index > 0:
+            total += self._sums[index]
+            index -= index & -index
+        return total
+
+    def get(self, child):
+        """Gets the position of a child, None if it is not indexed."""
+        block = self._block_of.get(child)
+        if block is None:
+            return None
+        return self._before(block.index) + self._offsets[child]
+
+    def insert(self, position, child):
+        """Indexes a child inserted before position, or appended if
+        position is the number of children."""
+        # Walk down the Fenwick tree to the block holding position
+        index = 0
+        remaining = position
+        step = 1 << (len(self._blocks).bit_length() - 1)
+        while step:
+            if (
+                index + step < len(self._sums)
+                and self._sums[index + step] <= remaining
+            ):
+                index += step
+                remaining -= self._sums[index]
+            step >>= 1
+        if index == len(self._blocks):
+            index -= 1
+            remaining = len(self._blocks[index].children)
+
+        block = self._blocks[index]
+        block.children.insert(remaining, child)
+        self._fill(block, remaining)
+        self._add(index, 1)
+        self._size += 1
+
+        if len(block.children) > 2 * BLOCK_SIZE:
+            split = _Block(block.children[BLOCK_SIZE:])
+            del block.children[BLOCK_SIZE:]
+            self._blocks.insert(index + 1, split)
+            self._fill(split, 0)
+            self._build_sums()
+
+
+class IndexedTree:
+    """Tree wrapper that keeps the root children indexed by tag and
+    position.
+
+    Lookups of root children by tag (findall and find with a plain tag like
+    'custom:Span') are served from the index instead of walking the root,
+    and the position of a child is found in logarithmic time, also after
+    inserts in the middle (see _PositionIndex). It can be used
+    wherever a tree is expected. add_element, remove_elements and the other
+    functions changing the root children update the index incrementally;
+    code changing the root directly has to call refresh afterwards.
+    Offsets are not indexed, so the sofa editors need no updates.
+
+    Args:
+        tree (ElementTree object): tree to be indexed
+        namespaces (dict): namespace dictionary the tree uses
+    """
+
+    def __init__(self, tree, namespaces):
+        self.tree = tree
+        self.namespaces = namespaces
+        self.refresh()
+
+    def refresh(self):
+        """Rebuilds the index from the root children."""
+        self._by_tag = {}
+        for child in self.tree.getroot():
+            self._by_tag.setdefault(child.tag, []).append(child)
+        self._positions = _PositionIndex(self.tree.getroot())
+
+    def _qualify(self, tag, namespaces=None):
+        namespaces = self.namespaces if namespaces is None else namespaces
+        prefix, _, name = tag.partition(':')
+        if name and not tag.startswith('{') and prefix in namespaces:
+            return '{'+namespaces[prefix]+'}'+name
+        return tag
+
+    def getroot(self):
+        return self.tree.getroot()
+
+    def write(self, *args, **kwargs):
+        return self.tree.write(*args, **kwargs)
+
+    def iter(self, tag=None):
+        return self.tree.iter(tag)
+
+    def findall(self, path, namespaces=None):
+        if not _SIMPLE_TAG.match(path):
+            return self.tree.findall(path, namespaces)
+        return self.elements(self._qualify(path, namespaces))
+
+    def find(self, path, namespaces=None):
+        if not _SIMPLE_TAG.match(path):
+            return self.tree.find(path, namespaces)
+        children = self._by_tag.get(self._qualify(path, namespaces))
+        return children[0] if children else None
+
+    def elements(self, tag):
+        """Gets the root children with a tag in document order."""
+        return list(self._by_tag.get(self._qualify(tag), ()))
+
+    def count(self, tag):
+        """Gets the number of root children with a tag."""
+        return len(self._by_tag.get(self._qualify(tag), ()))
+
+    def tag_counts(self):
+        """Gets the number of root children per tag."""
+        return {
+            tag: len(children)
+            for tag, children in self._by_tag.items() if children
+        }
+
+    def position(self, element):
+        """Gets the index of a root child, None if it is not one."""
+        return self._positions.get(element)
+
+    def first_position(self, tag):
+        """Gets the index of the first root child with a tag, None if
+        there is none."""
+        children = self._by_tag.get(self._qualify(tag))
+        return self.position(children[0]) if children else None
+
+    def insert(self, position, element):
+        """Inserts a root child before position, or appends it if position
+        is None.
+
+        Appending keeps the index up to date in constant time, inserting
+        elsewhere in logarithmic time plus the rest of a block.
+        """
+        root = self.tree.getroot()
+        children = self._by_tag.setdefault(element.tag, [])
+        length = len(self._positions)
+
+        if position is None or position >= length:
+            self._positions.insert(length, element)
+            root.append(element)
+            children.append(element)
+            return
+
+        if position < 0:
+            position = max(length + position, 0)
+        # Same-tag children are in document order, so their positions are
+        # sorted and the new child goes before the first one at position
+        low, high = 0, len(children)
+        while low < high:
+            middle = (low + high) // 2
+            if self._positions.get(children[middle]) < position:
+                low = middle + 1
+            else:
+                high = middle
+        children.insert(low, element)
+        root.insert(position, element)
+        self._positions.insert(position, element)
+
+    def set_children(self, children):
+        """Replaces the root children and reindexes them in the same pass."""
+        self.tree.getroot()[:] = children
+        self.refresh()
+
+
+def insert_child(tree, position, element):
+    """Inserts a root child into a plain or indexed tree, see
+    IndexedTree.insert."""
+    if isinstance(tree, AnnotationViews):
+        tree = tree.tree
+    if isinstance(tree, IndexedTree):
+        tree.insert(position, element)
+    elif position is None:
+        tree.getroot().append(element)
+    else:
+        tree.getroot().insert(position, element)
+
+
+def set_children(tree, children):
+    """Replaces the root children of a plain or indexed tree."""
+    if isinstance(tree, AnnotationViews):
+        tree = tree.tree
+    if isinstance(tree, IndexedTree):
+        tree.set_children(children)
+    else:
+        tree.getroot()[:] = children
@@ -0,0 +1,305 @@
+import inspect
+import json
+import os
+import time
+from collections import namedtuple
+from . import xmi_handling as xh
+from . import element_editing as ed
+from . import sofa_editing as se
+from . import complex_operations as co
+from . import regexes
+from .indexed_tree import IndexedTree
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+
+STEP_MODULES = {
+    'element_editing': ed,
+    'sofa_editing': se,
+    'complex_operations': co,
+}
+
+StepReport = namedtuple(
+    'StepReport',
+    ['index', 'name', 'seconds', 'counts_before', 'counts_after',
+     'sofa_delta', 'removed']
+)
+
+
+def load_config(filepath):
+    """Reads a pipeline definition from a .json or .toml file.
+
+    The definition holds a list of steps under 'steps'. Every step names a
+    function as 'module.function' (modules from STEP_MODULES) and may give
+    its keyword arguments under 'args' and a name under 'name':
+
+        {"steps": [
+            {"function": "sofa_editing.sofa_regex_replace",
+             "args": {"regex": {"regex": "ZEITUNG_PATTERN"},
+                      "insertion": "", "batched": true}}
+        ]}
+
+    Argument values of the form {"regex": NAME} are replaced by the pattern
+    NAME from the regexes module. Prefixed keys like 'xmi:id' in argument
+    dicts are turned into qualified attribute names. tree, namespaces and
+    counts are passed by the runner. A step with "cache": true keeps its
+    result in the build cache, see build_cache.BuildCache.
+
+    Raises:
+        ValueError: if the file is neither .json nor .toml, or TOML is
+            not supported by the installed Python
+    """
+
+    if filepath.endswith('.json'):
+        with open(filepath, encoding='utf-8') as file_:
+            return json.load(file_)
+    if filepath.endswith('.toml'):
+        if tomllib is None:
+            raise ValueError('TOML configs require Python 3.11 or tomli.')
+        with open(filepath, 'rb') as file_:
+            return tomllib.load(file_)
+    raise ValueError(f'{filepath} is neither a .json nor a .toml config.')
+
+
+def _resolve_value(value, namespaces):
+    if isinstance(value, dict):
+        if set(value) == {'regex'}:
+            try:
+                return getattr(regexes, value['regex'])
+            except AttributeError:
+                raise ValueError(f'Unknown regex {value["regex"]}.')
+        return {
+            xh.qualified_tag(key, namespaces):
+                _resolve_value(item, namespaces)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [_resolve_value(item, namespaces) for item in value]
+    return value
+
+
+def resolve_steps(config):
+    """Gets (name, function, args) for every step of a pipeline definition.
+
+    Raises:
+        ValueError: if a step names an unknown function
+    """
+
+    steps = []
+    for step in config['steps']:
+        module_name, _, function_name = step['function'].partition('.')
+        module = STEP_MODULES.get(module_name)
+        function = getattr(module, function_name, None)
+        if function is None:
+            raise ValueError(f'Unknown step function {step["function"]}.')
+        steps.append((
+            step.get('name', function_name), function, step.get('args', {})
+        ))
+    return steps
+
+
+def element_counts(tree, namespaces):
+    """Gets the number of root children per prefixed tag."""
+    if isinstance(tree, IndexedTree):
+        counts = tree.tag_counts()
+    else:
+        counts = {}
+        for child in tree.getroot():
+            counts[child.tag] = counts.get(child.tag, 0) + 1
+    return {
+        xh.prefixed_tag(tag, namespaces): count
+        for tag, count in counts.items()
+    }
+
+
+def checkpoint_path(checkpoint_dir, index, name):
+    """Gets the path of the document written after a step."""
+    return os.path.join(checkpoint_dir, f'{index:02d}_{name}.xmi')
+
+
+def step_index(steps, step):
+    """Gets the index of a step given by index or name.
+
+    Raises:
+        ValueError: if there is no such step
+    """
+    if isinstance(step, int):
+        if not 0 <= step <= len(steps):
+            raise ValueError(f'Step {step} out of range.')
+        return step
+    for index, (name, _, _) in enumerate(steps):
+        if name == step:
+            return index
+    raise ValueError(f'Unknown step {step}.')
+
+
+def run_step(function, args, tree, namespaces):
+    """Calls a step function with its arguments, passing tree, namespaces
+    and a counts dict where the function accepts them.
+
+    Returns:
+        tuple: the tree returned by the step and the counts of removed
+            elements (empty if the function takes no counts)
+    """
+
+    parameters = inspect.signature(function).parameters
+    kwargs = _resolve_value(args, namespaces)
+    kwargs['tree'] = tree
+    if 'namespaces' in parameters:
+        kwargs['namespaces'] = namespaces
+    removed = {}
+    if 'counts' in parameters:
+        kwargs['counts'] = removed
+    return function(**kwargs), removed
+
+
+def run_pipeline(
+    steps, tree, namespaces, start=0, checkpoint_dir=None, after_step=None
+):
+    """Runs pipeline steps over a loaded document.
+
+    Args:
+        steps (list): (name, function, args) tuples, see resolve_steps
+        tree (ElementTree object): document to be edited, wrapped in an
+            IndexedTree if it is not one already
+        namespaces (dict): namespace dictionary the tree uses
+        start (int or str): index or name of the first step to run
+        checkpoint_dir (str): if given, the document is written there after
+            every step, so a later run can resume from the next one
+        after_step (callable): if given, called with the index, name and
+            tree after every step
+
+    Returns:
+        tuple: the edited tree and a StepReport per step run
+    """
+
+    if not isinstance(tree, IndexedTree):
+        tree = IndexedTree(tree, namespaces)
+    start = step_index(steps, start)
+    reports = []
+
+    for index in range(start, len(steps)):
+        name, function, args = steps[index]
+        counts_before = element_counts(tree, namespaces)
+        sofa_before = len(xh.get_sofa_string(tree, namespaces))
+
+        started = time.perf_counter()
+        tree, removed = run_step(function, args, tree, namespaces)
+        seconds = time.perf_counter() - started
+
+        reports.append(StepReport(
+            index, name, seconds,
+            counts_before, element_counts(tree, namespaces),
+            len(xh.get_sofa_string(tree, namespaces)) - sofa_before,
+            {
+                xh.prefixed_tag(tag, namespaces): count
+                for tag, count in removed.items()
+            }
+        ))
+        if checkpoint_dir is not None:
+            xh.default_write(
+                tree, checkpoint_path(checkpoint_dir, index, name)
+            )
+        if after_step is not None:
+            after_step(index, name, tree)
+
+    return tree, reports
+
+
+def run_pipeline_file(
+    config, input_path, output_path, start=0, checkpoint_dir=None,
+    cache=None
+):
+    """Runs a pipeline over an xmi file and writes the result.
+
+    When resuming from a later step, the document is read from the
+    checkpoint the previous run wrote after the step before it. With a
+    cache, the run starts after the latest step whose result is stored
+    for the same input and step definitions.
+
+    Args:
+        config (dict or str): pipeline definition or path of its file
+        input_path (str): xmi file to be edited
+        output_path (str): path the edited xmi file is written to
+        start (int or str): index or name of the first step to run
+        checkpoint_dir (str): directory of the checkpoints to write and
+            to resume from
+        cache (BuildCache): cache to reuse and store results in, see
+            build_cache.BuildCache. Only used when starting from step 0
+
+    Returns:
+        list: StepReport per step run, empty if the whole result came
+            from the cache
+
+    Raises:
+        ValueError: if resuming without a checkpoint to resume from
+    """
+
+    if isinstance(config, str):
+        config = load_config(config)
+    steps = resolve_steps(config)
+    start = step_index(steps, start)
+
+    if start > 0:
+        if checkpoint_dir is None:
+            raise ValueError('Resuming requires a checkpoint_dir.')
+        input_path = checkpoint_path(
+            checkpoint_dir, start - 1, steps[start - 1][0]
+        )
+        if not os.path.exists(input_path):
+            raise ValueError(f'No checkpoint {input_path} to resume from.')
+    if checkpoint_dir is not None:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    after_step = None
+    if cache is not None and start == 0 and steps:
+        keys = cache.step_keys(input_path, config['steps'])
+        hit = cache.latest(keys)
+        if hit is not None:
+            index, input_path = hit
+            if index == len(steps) - 1:
+                xh.copy_xmi(input_path, output_path)
+                return []
+            start = index + 1
+
+        def after_step(index, name, tree):
+            if index < len(steps) - 1 and config['steps'][index].get('cache'):
+                cache.store_tree(keys[index], tree)
+
+    tree, _, namespaces = xh.get_everything(input_path)
+    tree, reports = run_pipeline(
+        steps, tree, namespaces, start, checkpoint_dir, after_step
+    )
+    xh.default_write(tree, output_path)
+    if after_step is not None:
+        cache.store_file(keys[-1], output_path)
+
+    return reports
+
+
+def format_reports(reports):
+    """Formats step reports as a table, one line per step, followed by the
+    element count changes of every step."""
+
+    lines = [f'{"step":<32} {"seconds":>9} {"sofa delta":>11}']
+    for report in reports:
+        lines.append(
+            f'{report.index:02d} {report.name:<29} '
+            f'{report.seconds:>9.3f} {report.sofa_delta:>11}'
+        )
+        for tag in sorted(set(report.counts_before)
+                          | set(report.counts_after)):
+            before = report.counts_before.get(tag, 0)
+            after = report.counts_after.get(tag, 0)
+            if before != after:
+                lines.append(f'     {tag}: {before} -> {after}')
+    lines.append(
+        f'{"total":<32} {sum(r.seconds for r in reports):>9.3f}'
+    )
+    return '\n'.join(lines)
@@ -1,4 +1,14 @@
+import bisect
 import re
+from . import xmi_conversion_util as xcu
+from .annotation_store import AnnotationStore
+
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
 
 
 def positional_insert(original_string, insertion, position):
@@ -75,7 +85,8 @@ def adjust_annotations(tree, namespaces, change_len, position,
     With a deletion, the change_len should be negative.
 
     Args:
-        tree (ElementTree object): tree whose annotations will be adjusted
+        tree (ElementTree object): tree whose annotations will be adjusted,
+            or an AnnotationStore of it
         namespaces (dict): namespace dictionary the tree uses
         change_len (int): length of the inserted or deleted part of the
             string. If a deletion took place, change_len should be negative
@@ -89,18 +100,17 @@ def adjust_annotations(tree, namespaces, change_len, position,
     if annotations is None:
         annotations = ['type5:Token', 'type5:Sentence', 'custom:Span']
 
+    if isinstance(tree, AnnotationStore):
+        tree.shift(change_len, position, annotations)
+        return tree
+
     for annotation in annotations:
         for element in tree.findall(annotation, namespaces):
-            if int(element.get('begin')) >= position:
-                element.set(
-                    'begin',
-                    str(int(element.get('begin')) + change_len)
-                )
-            if int(element.get('end')) >= position + 1:
-                element.set(
-                    'end',
-                    str(int(element.get('end')) + change_len)
-                )
+            begin, end = xcu.element_coords(element)
+            if begin >= position:
+                element.set('begin', str(begin + change_len))
+            if end >= position + 1:
+                element.set('end', str(end + change_len))
 
     return tree
 
@@ -171,7 +181,10 @@ def next_regex_sofa_coordinates(regex, tree, namespaces):
         start = end - 5
 
 
-def sofa_regex_delete(regex, tree, namespaces):
+def sofa_regex_delete(regex, tree, namespaces, batched=False):
+
+    if batched:
+        return sofa_regex_edit_batched(regex, None, tree, namespaces)
 
     for match_ in next_regex_sofa_coordinates(regex, tree, namespaces):
         tree = sofa_string_delete(
@@ -185,7 +198,10 @@ def sofa_regex_delete(regex, tree, namespaces):
     return tree
 
 
-def sofa_regex_replace(regex, insertion, tree, namespaces):
+def sofa_regex_replace(regex, insertion, tree, namespaces, batched=False):
+
+    if batched:
+        return sofa_regex_edit_batched(regex, insertion, tree, namespaces)
 
     for match_ in next_regex_sofa_coordinates(regex, tree, namespaces):
         tree = sofa_string_delete(
@@ -218,3 +234,308 @@ def sofa_regex_replace_if(regex, capture, replacement, tree, namespaces):
         sofa.set('sofaString', new_string)
 
     return tree
+
+
+_CONTEXT_OPCODES = {
+    sre_constants.AT,
+    sre_constants.ASSERT,
+    sre_constants.ASSERT_NOT,
+    sre_constants.GROUPREF,
+    sre_constants.GROUPREF_EXISTS,
+}
+
+
+def _uses_context(parsed):
+    """Checks a parsed regex for anchors, lookarounds and backreferences."""
+    if isinstance(parsed, sre_parse.SubPattern):
+        for op, av in parsed:
+            if op in _CONTEXT_OPCODES or _uses_context(av):
+                return True
+    elif isinstance(parsed, (list, tuple)):
+        return any(_uses_context(item) for item in parsed)
+    return False
+
+
+def _is_context_free(pattern):
+    """Checks whether the matches of a pattern only depend on the
+    characters they consume, so that searching from a position gives the
+    same matches as searching a slice starting there."""
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except Exception:
+        return False
+    return not _uses_context(parsed)
+
+
+def _context_free_width(pattern):
+    """Gets the maximum match width of a pattern whose matches only depend
+    on the characters they consume. Returns None for any other pattern."""
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+        low, high = parsed.getwidth()
+    except Exception:
+        return None
+    if low < 1 or high >= sre_constants.MAXREPEAT or _uses_context(parsed):
+        return None
+    return high
+
+
+def _pieces_tail(pieces, length, pop=False):
+    """Gets (and optionally removes) the last chars of a list of
+    (string, begin, end) pieces."""
+    chunks = []
+    index = len(pieces) - 1
+    while length > 0:
+        string, begin, end = pieces[index]
+        take = min(length, end - begin)
+        chunks.append(string[end - take:end])
+        length -= take
+        if pop and take == end - begin:
+            pieces.pop()
+        elif pop:
+            pieces[index] = (string, begin, end - take)
+        index -= 1
+    return ''.join(reversed(chunks))
+
+
+def regex_sofa_edits(regex, sofa_string, insertion=None):
+    """Deletes or replaces all regex matches in a string in a single pass.
+
+    The matches are exactly the ones sofa_regex_delete (insertion is None)
+    and sofa_regex_replace would find match by match, including the restart
+    of the search 5 chars before the end of the previous match in the
+    already modified string. The string is only assembled once, and only
+    the few chars around a previous edit get copied when searching again.
+
+    Args:
+        regex (str): pattern whose matches should be deleted or replaced
+        sofa_string (str): string to be modified
+        insertion (str): replacement for every match, None for deletion
+
+    Raises:
+        ValueError: if a match falls outside the modified string, like
+            positional_delete does in the match by match functions
+
+    Returns:
+        tuple: the modified string and the list of (position, change_len)
+            edits in the order sofa_string_delete and sofa_string_insert
+            would have applied them
+    """
+
+    pattern = re.compile(regex)
+    context_free = _is_context_free(pattern)
+    width = _context_free_width(pattern)
+
+    # The current string is the joined pieces + sofa_string[src:]
+    pieces = []
+    out_len = 0
+    src = 0
+    edits = []
+    start = 0
+
+    while True:
+        current_len = out_len + len(sofa_string) - src
+
+        if start < 0 or start > current_len:
+            current = ''.join(
+                string[begin:end] for string, begin, end in pieces
+            ) + sofa_string[src:]
+            match_ = pattern.search(current[start:])
+            offset = start
+        elif start >= out_len:
+            if context_free:
+                match_ = pattern.search(sofa_string, src + start - out_len)
+                offset = out_len - src
+            else:
+                match_ = pattern.search(sofa_string[src + start - out_len:])
+                offset = start
+        else:
+            head = _pieces_tail(pieces, out_len - start)
+            if width is None:
+                match_ = pattern.search(head + sofa_string[src:])
+                offset = start
+            else:
+                # Matches starting in the head only depend on the next
+                # width chars, everything later is found in sofa_string
+                match_ = pattern.search(
+                    head + sofa_string[src:src + width]
+                )
+                offset = start
+                if match_ is None or match_.start() >= len(head):
+                    match_ = pattern.search(sofa_string, src)
+                    offset = out_len - src
+
+        if not match_:
+            break
+
+        begin = match_.start() + offset
+        end = match_.end() + offset
+        if begin < 0:
+            raise ValueError(
+                'Position and deletion_len must be greater or equal to 0.'
+            )
+        if end > current_len:
+            raise ValueError(
+                'Deletion length greater than string length.'
+            )
+
+        if begin >= out_len:
+            pieces.append((sofa_string, src, src + begin - out_len))
+            src += begin - out_len
+            rest = ''
+        else:
+            rest = _pieces_tail(pieces, out_len - begin, pop=True)
+        out_len = begin
+
+        deletion_len = end - begin
+        if deletion_len <= len(rest):
+            rest = rest[deletion_len:]
+        else:
+            src += deletion_len - len(rest)
+            rest = ''
+        edits.append((begin, -deletion_len))
+
+        if insertion is not None:
+            pieces.append((insertion, 0, len(insertion)))
+            out_len += len(insertion)
+            edits.append((begin, len(insertion)))
+        if rest:
+            pieces.append((rest, 0, len(rest)))
+            out_len += len(rest)
+
+        start = end - 5
+
+    new_string = ''.join(
+        string[begin:end] for string, begin, end in pieces
+    ) + sofa_string[src:]
+
+    return new_string, edits
+
+
+def offset_tables(edits):
+    """Turns a sequence of edits into cumulative delta tables.
+
+    Each table covers a run of edits whose positions never move back
+    before the previous edit, so that an original offset can be mapped
+    through the whole run with a single binary search.
+
+    Args:
+        edits (list): (position, change_len) tuples in the order they
+            were applied to the sofaString
+
+    Returns:
+        list: (thresholds, deltas) tuples, one per run
+    """
+
+    tables = []
+    thresholds, deltas = [], [0]
+    last_position, last_change = None, 0
+
+    for position, change_len in edits:
+        if (
+            last_position is not None
+            and position < last_position + max(last_change, 0)
+        ):
+            tables.append((thresholds, deltas))
+            thresholds, deltas = [], [0]
+        thresholds.append(position - deltas[-1])
+        deltas.append(deltas[-1] + change_len)
+        last_position, last_change = position, change_len
+
+    if thresholds:
+        tables.append((thresholds, deltas))
+
+    return tables
+
+
+def remap_offset(offset, tables, is_end=False):
+    """Maps an annotation offset through delta tables from offset_tables.
+
+    Follows the rules of adjust_annotations: a begin is shifted when it is
+    at or after the edit position, an end when it is after it.
+
+    Returns:
+        tuple: the new offset and whether any edit shifted it
+    """
+
+    shifted = False
+    for thresholds, deltas in tables:
+        if is_end:
+            index = bisect.bisect_left(thresholds, offset)
+        else:
+            index = bisect.bisect_right(thresholds, offset)
+        if index:
+            offset += deltas[index]
+            shifted = True
+
+    return offset, shifted
+
+
+def adjust_annotations_batched(tree, namespaces, edits, annotations=None):
+    """Adjusts annotations for a whole sequence of sofaString edits at once.
+
+    Gives the same result as calling adjust_annotations for every edit in
+    order, but parses and writes every begin and end only once.
+
+    Args:
+        tree (ElementTree object): tree whose annotations will be adjusted,
+            or an AnnotationStore of it
+        namespaces (dict): namespace dictionary the tree uses
+        edits (list): (position, change_len) tuples in the order they
+            were applied to the sofaString
+
+    Returns:
+        ElementTree object: tree with adjusted annotations
+    """
+
+    if annotations is None:
+        annotations = ['type5:Token', 'type5:Sentence', 'custom:Span']
+
+    tables = offset_tables(edits)
+    if not tables:
+        return tree
+
+    if isinstance(tree, AnnotationStore):
+        tree.remap(tables, annotations)
+        return tree
+
+    for annotation in annotations:
+        for element in tree.findall(annotation, namespaces):
+            begin, end = xcu.element_coords(element)
+            begin, shifted = remap_offset(begin, tables)
+            if shifted:
+                element.set('begin', str(begin))
+            end, shifted = remap_offset(end, tables, is_end=True)
+            if shifted:
+                element.set('end', str(end))
+
+    return tree
+
+
+def sofa_regex_edit_batched(regex, insertion, tree, namespaces):
+    """Batched version of sofa_regex_delete and sofa_regex_replace.
+
+    Gathers all matches first, builds the new sofaString once and remaps
+    every annotation in one sweep. The result is identical to the match by
+    match functions.
+
+    Args:
+        regex (str): pattern whose matches should be deleted or replaced
+        insertion (str): replacement for every match, None for deletion
+        tree (ElementTree object): tree whose sofaString and annotations will
+            be adjusted
+        namespaces (dict): namespace dictionary the tree uses
+
+    Returns:
+        ElementTree object: tree with adjusted sofaString and annotations
+    """
+
+    sofa = tree.find('cas:Sofa', namespaces)
+    new_string, edits = regex_sofa_edits(
+        regex, sofa.get('sofaString'), insertion
+    )
+    if not edits:
+        return tree
+    sofa.set('sofaString', new_string)
+
+    return adjust_annotations_batched(tree, namespaces, edits)
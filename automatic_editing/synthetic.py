@@ -0,0 +1,210 @@
+import random
+from xml.sax.saxutils import quoteattr
+from . import xmi_handling as xh
+
+
+NAMESPACE_DECLARATIONS = (
+    'xmlns:xmi="http://www.omg.org/XMI" '
+    'xmlns:cas="http:///uima/cas.ecore" '
+    'xmlns:type5="http:///de/tudarmstadt/ukp/dkpro/core/api/segmentation/'
+    'type.ecore" '
+    'xmlns:custom="http:///webanno/custom.ecore"'
+)
+
+WORDS = (
+    'Das', 'ist', 'nicht', 'gerecht', 'und', 'gut', 'Moral', 'oder',
+    'schlecht', 'die', 'Regierung', 'muss', 'endlich', 'handeln', 'wir',
+    'alle', 'sollten', 'uns', 'schämen', 'Verantwortung',
+)
+
+# Label weights per category, applied to the spans of that category
+DEFAULT_LABELS = {
+    'KAT1MoralisierendesSegment': {
+        'Moralisierung explizit': 4,
+        'Moralisierung interpretativ': 3,
+        'Moralisierung Kontext': 1,
+        'Moralisierung Weltwissen': 1,
+        'Moralisierung': 1,
+        'Keine Moralisierung': 6,
+    },
+    'Protagonistinnen': {
+        'Adressat:in': 3,
+        'Benefizient:in': 2,
+        'Forderer:in': 2,
+        'Malefizient:in': 2,
+        'Kein Bezug': 1,
+    },
+    'Protagonistinnen2': {
+        'soziale Gruppe': 3,
+        'Institution': 2,
+        'Individuum': 2,
+        'Mensch': 1,
+        'OTHER': 1,
+    },
+    'Moralwerte': {
+        'Fürsorge': 3,
+        'Fairness': 3,
+        'Autorität': 1,
+        'OTHER': 1,
+    },
+    'KommunikativeFunktion': {
+        'Appell': 1,
+        'Bewertung': 2,
+    },
+}
+
+
+def _choose(rng, weights):
+    return rng.choices(list(weights), list(weights.values()))[0]
+
+
+def generate_xmi(
+    sentences=1000, tokens_per_sentence=12, spans_per_sentence=2,
+    moralization_share=0.5, marker_every=10, noise=0.01, labels=None,
+    sofa_length=None, seed=0
+):
+    """Generates a DKPro-style xmi document with random but reproducible
+    content.
+
+    The sofa consists of sentences of words ending in a full stop. After
+    every marker_every sentences, a newspaper source line ending in ###
+    (matched by regexes.ZEITUNG_PATTERN) is inserted, as in the raw
+    corpus. Every word and full stop gets a token and every sentence a
+    sentence annotation. A share of the sentences gets a sentence-wide
+    KAT1MoralisierendesSegment span, and spans_per_sentence protagonist,
+    value or function spans are placed on random tokens. A share of noise
+    extra tokens and spans is whitespace, overlapping, duplicated or has a
+    group annotation, so that the cleanup functions have something to do.
+
+    Args:
+        sentences (int): number of sentences
+        tokens_per_sentence (int): average number of words per sentence
+        spans_per_sentence (float): average number of token spans per
+            sentence
+        moralization_share (float): share of sentences with a
+            KAT1MoralisierendesSegment span
+        marker_every (int): sentences between ### source lines, no source
+            lines if None
+        noise (float): share of extra whitespace, overlapping and
+            duplicate annotations
+        labels (dict): label weights per category, see DEFAULT_LABELS
+        sofa_length (int): if given, sentences are generated until the
+            sofa has at least this length, instead of a fixed number
+        seed (int): seed of the random generator
+
+    Returns:
+        str: the xmi document
+    """
+
+    rng = random.Random(seed)
+    labels = DEFAULT_LABELS if labels is None else labels
+    token_categories = [
+        category for category in labels
+        if category != 'KAT1MoralisierendesSegment'
+    ]
+
+    pieces = []
+    length = 0
+    tokens = []
+    sentence_coords = []
+    spans = []
+
+    def add(text):
+        nonlocal length
+        pieces.append(text)
+        length += len(text)
+
+    count = 0
+    while (
+        length < sofa_length if sofa_length is not None
+        else count < sentences
+    ):
+        if marker_every and count and count % marker_every == 0:
+            add(
+                f'NUZ{rng.randint(10, 99)}/JAN.{rng.randint(10000, 99999)} '
+                f'Nürnberger Zeitung, {rng.randint(1, 28):02d}.01.2012, '
+                f'S. {rng.randint(1, 40)} ###\n'
+            )
+        count += 1
+
+        begin = length
+        sentence_tokens = []
+        words = max(1, int(rng.gauss(tokens_per_sentence, 3)))
+        for index in range(words):
+            word = rng.choice(WORDS)
+            sentence_tokens.append((length, length + len(word)))
+            add(word)
+            if index < words - 1:
+                if rng.random() < noise:
+                    tokens.append((length, length + 1))  # Whitespace token
+                add(' ')
+        sentence_tokens.append((length, length + 1))
+        add('.')
+        end = length
+        add(' ')
+
+        tokens.extend(sentence_tokens)
+        if rng.random() < noise:
+            token_begin, token_end = rng.choice(sentence_tokens)
+            tokens.append((token_begin, min(token_begin + 2, token_end)))
+        sentence_coords.append((begin, end))
+
+        if rng.random() < moralization_share:
+            category = 'KAT1MoralisierendesSegment'
+            label = _choose(rng, labels[category])
+            spans.append((begin, end, {category: label}))
+            if rng.random() < noise:
+                spans.append((begin, end, {category: 'Moralisierung'}))
+
+        span_count = int(spans_per_sentence) + (
+            rng.random() < spans_per_sentence % 1
+        )
+        for _ in range(span_count):
+            if not token_categories:
+                break
+            span_begin, span_end = rng.choice(sentence_tokens[:-1])
+            category = rng.choice(token_categories)
+            attributes = {category: _choose(rng, labels[category])}
+            if category == 'Protagonistinnen' and rng.random() > noise:
+                attributes['Protagonistinnen2'] = _choose(
+                    rng, labels.get('Protagonistinnen2', {'OTHER': 1})
+                )
+            if category == 'Protagonistinnen' and rng.random() < noise:
+                attributes['Protagonistinnen3'] = 'Gruppe'
+            spans.append((span_begin, span_end, attributes))
+
+    lines = [
+        f'<xmi:XMI {NAMESPACE_DECLARATIONS} xmi:version="2.0">',
+        '<cas:NULL xmi:id="0" />',
+        f'<cas:Sofa xmi:id="1" sofaString={quoteattr("".join(pieces))} '
+        'mimeType="text" />',
+    ]
+    next_id = 2
+    for tag, items in (
+        ('type5:Sentence', [(b, e, {}) for b, e in sentence_coords]),
+        ('type5:Token', [(b, e, {}) for b, e in tokens]),
+        ('custom:Span', spans),
+    ):
+        for begin, end, attributes in items:
+            extra = ''.join(
+                f' {key}={quoteattr(value)}'
+                for key, value in attributes.items()
+            )
+            lines.append(
+                f'<{tag} xmi:id="{next_id}" sofa="1" '
+                f'begin="{begin}" end="{end}"{extra} />'
+            )
+            next_id += 1
+    members = ' '.join(str(member) for member in range(2, next_id))
+    lines.append(f'<cas:View sofa="1" members="{members}" />')
+    lines.append('</xmi:XMI>')
+
+    return "<?xml version='1.0' encoding='UTF-8'?>\n" + '\n    '.join(lines)
+
+
+def write_synthetic_xmi(filepath, **parameters):
+    """Writes a document made by generate_xmi, compressed if the filename
+    asks for it (see xmi_handling.open_xmi)."""
+    xh.xmi_filename_extension(filepath)
+    with xh.open_xmi(filepath, 'wb') as file_:
+        file_.write(generate_xmi(**parameters).encode('utf-8'))
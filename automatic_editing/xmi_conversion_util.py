@@ -1,10 +1,109 @@
+import bisect
+from .annotation_view import AnnotationView
+
+
+class IntervalIndex:
+    """Index over annotation coordinates for containment queries.
+
+    Items are sorted by begin once, with a max-end segment tree on top, so
+    that the items containing a span and the items inside a span are found
+    in logarithmic time (plus the number of hits). Hits are always returned
+    in the order the items were given in.
+
+    Args:
+        items (iterable): elements or (begin, end) coordinates
+        key (callable): gets the (begin, end) ints of an item. Defaults to
+            reading the begin and end attributes of elements, and to the
+            item itself for coordinate pairs
+    """
+
+    def __init__(self, items, key=None):
+        items = list(items)
+        if key is None:
+            key = element_coords if items and hasattr(
+                items[0], 'get'
+            ) else tuple
+        entries = sorted(
+            (tuple(key(item)), position, item)
+            for position, item in enumerate(items)
+        ) if items else []
+
+        self.begins = [coords[0] for coords, _, _ in entries]
+        self.ends = [coords[1] for coords, _, _ in entries]
+        self.positions = [position for _, position, _ in entries]
+        self.items = [item for _, _, item in entries]
+
+        self._size = 1
+        while self._size < len(self.items):
+            self._size *= 2
+        self._max_end = [float('-inf')] * (2 * self._size)
+        self._max_end[self._size:self._size + len(self.ends)] = self.ends
+        for node in range(self._size - 1, 0, -1):
+            self._max_end[node] = max(
+                self._max_end[2 * node], self._max_end[2 * node + 1]
+            )
+
+    def __len__(self):
+        return len(self.items)
+
+    def _collect(self, node, low, high, limit, end, found):
+        if low >= limit or self._max_end[node] < end:
+            return
+        if high - low == 1:
+            found.append(low)
+            return
+        middle = (low + high) // 2
+        self._collect(2 * node, low, middle, limit, end, found)
+        self._collect(2 * node + 1, middle, high, limit, end, found)
+
+    def _ordered(self, indices):
+        indices.sort(key=lambda index: self.positions[index])
+        return [self.items[index] for index in indices]
+
+    def containing(self, coords):
+        """Gets all items whose coordinates contain the given coordinates."""
+        found = []
+        limit = bisect.bisect_right(self.begins, coords[0])
+        if limit:
+            self._collect(1, 0, self._size, limit, coords[1], found)
+        return self._ordered(found)
+
+    def first_containing(self, coords):
+        """Gets the first item containing the coordinates, None if none."""
+        hits = self.containing(coords)
+        return hits[0] if hits else None
+
+    def inside(self, coords):
+        """Gets all items whose coordinates lie inside the coordinates."""
+        low = bisect.bisect_left(self.begins, coords[0])
+        high = bisect.bisect_right(self.begins, coords[1])
+        return self._ordered([
+            index for index in range(low, high)
+            if self.ends[index] <= coords[1]
+        ])
+
+
+def element_coords(element):
+    """Gets the begin and end attributes of an element as ints."""
+    if isinstance(element, AnnotationView):
+        if element.begin is not None and element.end is not None:
+            return element.begin, element.end
+        element = element.element  # Fails like the element would
+    return int(element.get('begin')), int(element.get('end'))
+
+
 def inside_of_list(coord_list_outer, coord_inner):
     """
     Checks whether the specific coordinates
     are inside any of the coordinates on the list
     Returns the first match, or None if there is no match.
+    coord_list_outer can also be an IntervalIndex over coordinates.
     """
 
+    if isinstance(coord_list_outer, IntervalIndex):
+        match_ = coord_list_outer.first_containing(coord_inner)
+        return match_ if match_ is not None else False
+
     for coord_outer in coord_list_outer:
         if inside_of(coord_outer, coord_inner):
             return coord_outer
@@ -27,24 +126,15 @@ def inside_of(coord_outer, coord_inner):
 def sentence_associations(category, tree, namespaces):
 
     sentences = tree.findall('type5:Sentence', namespaces)
-    annotations = [
+    annotations = IntervalIndex(
         span for span in tree.findall('custom:Span', namespaces)
         if span.get(category)
-    ]
+    )
 
     associations_dict = {
-        sentence: [] for sentence in sentences
+        sentence: annotations.inside(element_coords(sentence))
+        for sentence in sentences
     }
-    for sentence in sentences:
-        sentence_range = (
-            int(sentence.get('begin')), int(sentence.get('end'))
-        )
-        for annotation in annotations:
-            moral_range = (
-                int(annotation.get('begin')), int(annotation.get('end'))
-            )
-            if inside_of(sentence_range, moral_range):
-                associations_dict[sentence].append(annotation)
 
     return associations_dict
 
@@ -77,6 +167,9 @@ def narrow_coords(coordinates, text, whitespace=' \n\t'):
 
 
 def get_coords(element):
+    if isinstance(element, AnnotationView) and element.begin is not None:
+        if element.end is not None:
+            return [element.begin, element.end]
     try:
         coords = [int(element.get('begin')), int(element.get('end'))]
         return coords
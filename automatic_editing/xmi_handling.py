@@ -1,9 +1,74 @@
+import bz2
+import gzip
+import io
+import lzma
+import os
+import shutil
+import tempfile
+import time
 import xml.etree.ElementTree as ET
+from collections import namedtuple
+from contextlib import contextmanager, nullcontext
+from .annotation_view import AnnotationViews, unwrap
+from .indexed_tree import IndexedTree
+
+try:
+    from lxml import etree as LXML
+except ImportError:
+    LXML = None
+
+
+BACKENDS = ('lxml', 'etree')
+_backend = 'lxml' if LXML is not None else 'etree'
+
+COMPRESSIONS = {'.gz': gzip, '.bz2': bz2, '.xz': lzma}
+XMI_EXTENSIONS = ('.xmi',) + tuple('.xmi' + suffix for suffix in COMPRESSIONS)
+_compression_level = None
+
+WRITE_BUFFER_SIZE = 1 << 20
+# Reading the umask means setting it, which would race with threads
+# creating files, so it is read once
+_umask = os.umask(0)
+os.umask(_umask)
+WriteReport = namedtuple('WriteReport', ['path', 'bytes', 'seconds'])
+
+
+def set_backend(name):
+    """Chooses the library used to parse xmi files.
+
+    'lxml' is used by default when it is installed, 'etree' (the standard
+    library ElementTree) otherwise. Trees of both backends are written with
+    default_write and work with all editing functions.
+    """
+    global _backend
+    if name not in BACKENDS:
+        raise ValueError(f'Unknown backend {name}, choose from {BACKENDS}.')
+    if name == 'lxml' and LXML is None:
+        raise ValueError('The lxml backend requires lxml to be installed.')
+    _backend = name
+
+
+def get_backend():
+    """Gets the name of the library currently used to parse xmi files."""
+    return _backend
+
+
+def set_compression_level(level):
+    """Sets the level (0-9) compressed xmi files are written with.
+
+    Higher levels give smaller files for more CPU time. None uses the
+    default of each codec.
+    """
+    global _compression_level
+    if level is not None and not 0 <= level <= 9:
+        raise ValueError('Compression level must be between 0 and 9.')
+    _compression_level = level
 
 
 def xmi_filename_extension(filepath, raise_err=True):
-    """Checks a filename/path for .xmi filename extension."""
-    if not filepath.endswith('.xmi'):
+    """Checks a filename/path for .xmi filename extension, optionally
+    followed by .gz, .bz2 or .xz."""
+    if not filepath.endswith(XMI_EXTENSIONS):
         if raise_err:
             raise ValueError(
                 f'{filepath} is not an xmi according to filename extension.'
@@ -12,33 +77,247 @@ def xmi_filename_extension(filepath, raise_err=True):
     return True
 
 
+def compression_of(filepath):
+    """Gets the codec module (gzip, bz2 or lzma) a file is compressed with
+    according to its filename extension, None for plain files."""
+    for suffix, codec in COMPRESSIONS.items():
+        if filepath.endswith(suffix):
+            return codec
+    return None
+
+
+def open_xmi(filepath, mode='rb', codec=None):
+    """Opens a plain or compressed xmi file as a binary stream.
+
+    Args:
+        filepath (str): path of the file
+        mode (str): 'rb' or 'wb'
+        codec (module): gzip, bz2 or lzma to use instead of the one given
+            by the filename extension
+
+    Returns:
+        file object: decompressing or compressing stream for compressed
+            files, a plain file otherwise
+    """
+    if codec is None:
+        codec = compression_of(filepath)
+    if codec is None:
+        return open(filepath, mode)
+    if 'w' in mode:
+        return _compressor(codec, open(filepath, mode), owns_file=True)
+    return codec.open(filepath, mode)
+
+
+def _compressor(codec, file_, owns_file=False):
+    if codec is gzip:
+        level = 9 if _compression_level is None else _compression_level
+        stream = gzip.GzipFile(fileobj=file_, mode='wb', compresslevel=level)
+    elif codec is bz2:
+        level = 9 if _compression_level is None else _compression_level
+        stream = bz2.BZ2File(file_, 'wb', compresslevel=level)
+    else:
+        stream = lzma.LZMAFile(file_, 'wb', preset=_compression_level)
+    if owns_file:
+        # The codec streams do not close a file object they were given
+        close = stream.close
+
+        def close_both():
+            try:
+                close()
+            finally:
+                file_.close()
+        stream.close = close_both
+    return stream
+
+
+def _source(filepath):
+    # Plain files are handed to the parser by path, which lxml reads
+    # faster than a Python stream
+    if compression_of(filepath) is None:
+        return nullcontext(filepath)
+    return open_xmi(filepath)
+
+
+def _iterparse_namespaces(source):
+    if _backend == 'lxml':
+        return LXML.iterparse(source, events=['start-ns'], huge_tree=True)
+    return ET.iterparse(source, events=['start-ns'])
+
+
 def parse_xmi(filepath):
     """Gets tree and root of an xmi file."""
     xmi_filename_extension(filepath)
-    tree = ET.parse(filepath)
+    with _source(filepath) as source:
+        if _backend == 'lxml':
+            tree = LXML.parse(source, LXML.XMLParser(huge_tree=True))
+        else:
+            tree = ET.parse(source)
     root = tree.getroot()
 
     return tree, root
 
 
+def parse_xmi_namespaces(filepath):
+    """Gets tree, root and namespace dict of an xmi file in a single pass.
+
+    The namespaces are collected from the same iterparse run that builds
+    the tree, so the file is only read once.
+    """
+    xmi_filename_extension(filepath)
+    namespaces = {}
+    with _source(filepath) as source:
+        events = _iterparse_namespaces(source)
+        for _, (prefix, uri) in events:
+            namespaces[prefix] = uri
+    for prefix, uri in namespaces.items():
+        ET.register_namespace(prefix, uri)
+    root = events.root
+    if _backend == 'lxml':
+        tree = root.getroottree()
+    else:
+        tree = ET.ElementTree(root)
+
+    return tree, root, namespaces
+
+
 def get_namespaces(filepath):
     """Creates a namespace dict for an xmi file."""
     xmi_filename_extension(filepath)
-    namespaces = {
-        prefix: uri for _, (prefix, uri)
-        in ET.iterparse(filepath, events=['start-ns'])
-    }
+    with _source(filepath) as source:
+        namespaces = {
+            prefix: uri for _, (prefix, uri)
+            in _iterparse_namespaces(source)
+        }
     for prefix, uri in namespaces.items():
         ET.register_namespace(prefix, uri)
     return namespaces
 
 
-def default_write(tree, filepath):
-    """Creates an xmi file from a tree with default params for the project."""
-    tree.write(filepath,
-               encoding="utf-8",
-               xml_declaration=True,
-               method='xml')
+@contextmanager
+def isolated_namespaces():
+    """Undoes the namespace prefixes registered with ElementTree inside the
+    block once it is left.
+
+    get_namespaces and parse_xmi_namespaces register the prefixes of every
+    file globally, so a prefix of one file would otherwise be used when
+    writing the next one processed in the same interpreter.
+    """
+    registered = dict(ET._namespace_map)
+    try:
+        yield
+    finally:
+        ET._namespace_map.clear()
+        ET._namespace_map.update(registered)
+
+
+def _new_file_mode(filepath):
+    try:
+        return os.stat(filepath).st_mode & 0o777
+    except FileNotFoundError:
+        return 0o666 & ~_umask
+
+
+@contextmanager
+def _replacing(filepath, fsync=False):
+    """Opens a temporary file in the directory of filepath, which replaces
+    filepath in one rename once the block is left without an error."""
+    directory, filename = os.path.split(os.path.abspath(filepath))
+    handle, temporary = tempfile.mkstemp(
+        prefix='.' + filename + '.', suffix='.tmp', dir=directory
+    )
+    try:
+        with os.fdopen(handle, 'wb', buffering=WRITE_BUFFER_SIZE) as file_:
+            yield file_
+            file_.flush()
+            if fsync:
+                os.fsync(file_.fileno())
+        os.chmod(temporary, _new_file_mode(filepath))
+        os.replace(temporary, filepath)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+    if fsync and hasattr(os, 'O_DIRECTORY'):
+        # Make the rename itself durable
+        directory_handle = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(directory_handle)
+        finally:
+            os.close(directory_handle)
+
+
+def default_write(tree, filepath, codec=None, fsync=False):
+    """Creates an xmi file from a tree with default params for the project.
+
+    The serialisation is streamed through a large buffer into a temporary
+    file in the same directory, which then replaces filepath in one
+    rename. A crash or Ctrl-C while writing leaves the previous file
+    untouched. Files ending in .gz, .bz2 or .xz are compressed
+    accordingly, see set_compression_level. Also takes AnnotationViews
+    in place of the tree, whose changed coordinates are synced first.
+
+    Args:
+        tree (ElementTree object): tree to be written
+        filepath (str): path of the file
+        codec (module): gzip, bz2 or lzma to compress with instead of the
+            one given by the filename extension
+        fsync (bool): whether to force the file to disk before the rename
+
+    Returns:
+        WriteReport: path, bytes written and seconds taken
+    """
+    started = time.perf_counter()
+    tree = unwrap(tree)
+    if codec is None:
+        codec = compression_of(filepath)
+
+    with _replacing(filepath, fsync) as file_:
+        if codec is None:
+            tree.write(file_,
+                       encoding="utf-8",
+                       xml_declaration=True,
+                       method='xml')
+        else:
+            with io.BufferedWriter(
+                _compressor(codec, file_), WRITE_BUFFER_SIZE
+            ) as stream:
+                tree.write(stream,
+                           encoding="utf-8",
+                           xml_declaration=True,
+                           method='xml')
+        size = file_.tell()
+
+    return WriteReport(filepath, size, time.perf_counter() - started)
+
+
+def copy_xmi(source, target, fsync=False):
+    """Copies an xmi file, replacing target atomically like default_write.
+
+    The content is decompressed and compressed again if the filename
+    extensions of source and target name different codecs, so e.g.
+    copying a.xmi.gz to b.xmi gives a plain file.
+
+    Args:
+        source (str): path of the file to be copied
+        target (str): path of the copy
+        fsync (bool): whether to force the copy to disk before the rename
+    """
+    codec = compression_of(target)
+    with _replacing(target, fsync) as file_:
+        if compression_of(source) is codec:
+            with open(source, 'rb') as source_file:
+                shutil.copyfileobj(source_file, file_, WRITE_BUFFER_SIZE)
+        else:
+            with open_xmi(source) as source_file:
+                if codec is None:
+                    shutil.copyfileobj(source_file, file_, WRITE_BUFFER_SIZE)
+                else:
+                    with io.BufferedWriter(
+                        _compressor(codec, file_), WRITE_BUFFER_SIZE
+                    ) as stream:
+                        shutil.copyfileobj(
+                            source_file, stream, WRITE_BUFFER_SIZE
+                        )
 
 
 def get_sofa_string(tree, namespaces):
@@ -46,8 +325,31 @@ def get_sofa_string(tree, namespaces):
     return tree.find('cas:Sofa', namespaces).get('sofaString')
 
 
+def qualified_tag(tag, namespaces):
+    """Turns a prefixed tag like 'custom:Span' into its '{uri}Span' form."""
+    prefix, _, name = tag.partition(':')
+    if name and prefix in namespaces:
+        return '{'+namespaces[prefix]+'}'+name
+    return tag
+
+
+def prefixed_tag(tag, namespaces):
+    """Turns a '{uri}Span' tag into its prefixed 'custom:Span' form."""
+    if tag.startswith('{'):
+        uri, _, name = tag[1:].partition('}')
+        for prefix, known_uri in namespaces.items():
+            if known_uri == uri:
+                return prefix+':'+name
+    return tag
+
+
 def get_position_before_category(tree, element):
 
+    if isinstance(tree, AnnotationViews):
+        tree = tree.tree
+    if isinstance(tree, IndexedTree):
+        return tree.first_position(element)
+
     root = tree.getroot()
 
     for i, child in enumerate(root):
@@ -59,9 +361,18 @@ def get_position_before_category(tree, element):
 
 def get_position_before_element(tree, element, attribute_dict):
 
+    # Attributes are compared, so changed coordinates are synced
+    tree = unwrap(tree)
     root = tree.getroot()
+    if isinstance(tree, IndexedTree):
+        # Only the children with the tag need to be compared
+        children = (
+            (tree.position(child), child) for child in tree.elements(element)
+        )
+    else:
+        children = enumerate(root)
 
-    for i, child in enumerate(root):
+    for i, child in children:
         if child.tag == element:
             child_attribs = child.attrib
             hit = True
@@ -78,7 +389,4 @@ def get_position_before_element(tree, element, attribute_dict):
 
 
 def get_everything(filepath):
-    tree, root = parse_xmi(filepath)
-    namespaces = get_namespaces(filepath)
-
-    return tree, root, namespaces
+    return parse_xmi_namespaces(filepath)
@@ -0,0 +1,118 @@
+import xml.etree.ElementTree as ET
+from collections import Counter, namedtuple
+from itertools import chain
+from . import xmi_handling as xh
+
+
+AnnotationRecord = namedtuple(
+    'AnnotationRecord', ['tag', 'begin', 'end', 'attributes']
+)
+
+
+def _top_level_elements(events, namespaces):
+    """Yields the children of the root as they are completed, and clears
+    them from the root once the next one is requested."""
+    root = None
+    depth = 0
+
+    for event, item in events:
+        if event == 'start-ns':
+            namespaces[item[0]] = item[1]
+        elif event == 'start':
+            if root is None:
+                root = item
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 1:
+                yield item
+                root.clear()
+
+
+def _to_record(element):
+    begin = element.get('begin')
+    end = element.get('end')
+    return AnnotationRecord(
+        element.tag,
+        None if begin is None else int(begin),
+        None if end is None else int(end),
+        dict(element.attrib)
+    )
+
+
+def stream_xmi(filepath, tags=None):
+    """Reads an xmi file without building the whole tree.
+
+    The file is read until the cas:Sofa is found. Annotations are then
+    turned into lightweight records one at a time while the file is read,
+    and their elements are dropped right away. Memory use stays around the
+    size of the sofaString plus a single element.
+
+    Args:
+        filepath (str): path of the xmi file
+        tags (iterable): tags like 'custom:Span' of the annotations to be
+            yielded. All children of the root are yielded if not given
+
+    Returns:
+        tuple: namespace dict, sofaString (None if the file has no sofa)
+            and an iterator over AnnotationRecord tuples in file order
+    """
+
+    xh.xmi_filename_extension(filepath)
+    namespaces = {}
+    stream = xh.open_xmi(filepath)
+    events = ET.iterparse(stream, events=['start-ns', 'start', 'end'])
+    elements = _top_level_elements(events, namespaces)
+
+    sofa_string = None
+    wanted = None
+    before_sofa = []
+
+    for element in elements:
+        if wanted is None and tags is not None:
+            wanted = {xh.qualified_tag(tag, namespaces) for tag in tags}
+        if element.tag == xh.qualified_tag('cas:Sofa', namespaces):
+            sofa_string = element.get('sofaString')
+            break
+        if wanted is None or element.tag in wanted:
+            before_sofa.append(_to_record(element))
+
+    def records():
+        nonlocal wanted
+        try:
+            for element in elements:
+                if wanted is None and tags is not None:
+                    wanted = {
+                        xh.qualified_tag(tag, namespaces) for tag in tags
+                    }
+                if wanted is None or element.tag in wanted:
+                    yield _to_record(element)
+        finally:
+            stream.close()
+
+    return namespaces, sofa_string, chain(before_sofa, records())
+
+
+def count_labels(filepath, category, tag='custom:Span'):
+    """Counts the values of an attribute over a whole file while
+    streaming it.
+
+    Returns:
+        Counter: number of annotations per label
+    """
+
+    _, _, records = stream_xmi(filepath, [tag])
+    return Counter(
+        record.attributes[category] for record in records
+        if record.attributes.get(category)
+    )
+
+
+def stream_spans(filepath, tag='custom:Span', category=None):
+    """Yields the covered text and the record of every annotation with the
+    given tag (and with a value for category, if given)."""
+
+    _, sofa_string, records = stream_xmi(filepath, [tag])
+    for record in records:
+        if category is None or record.attributes.get(category):
+            yield sofa_string[record.begin:record.end], record
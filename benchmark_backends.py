@@ -0,0 +1,35 @@
+import os
+import tempfile
+import time
+from automatic_editing import xmi_handling as xh, synthetic
+
+
+def time_backend(backend, filepath, output):
+    xh.set_backend(backend)
+
+    start = time.perf_counter()
+    tree, _, _ = xh.get_everything(filepath)
+    parsed = time.perf_counter()
+    xh.default_write(tree, output)
+    written = time.perf_counter()
+
+    return parsed - start, written - parsed
+
+
+if __name__ == '__main__':
+    backends = [
+        backend for backend in xh.BACKENDS
+        if backend != 'lxml' or xh.LXML is not None
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, 'synthetic.xmi')
+        output = os.path.join(directory, 'output.xmi')
+        for sentences in (1000, 10000, 50000):
+            synthetic.write_synthetic_xmi(source, sentences=sentences)
+            size = os.path.getsize(source) / 1e6
+            for backend in backends:
+                parse_time, write_time = time_backend(backend, source, output)
+                print(
+                    f'{sentences:>6} sentences ({size:7.1f} MB) {backend:>6}:',
+                    f'parse {parse_time:7.3f}s, write {write_time:7.3f}s'
+                )
@@ -0,0 +1,690 @@
+import argparse
+import gc
+import inspect
+import json
+import os
+import tempfile
+import time
+from automatic_editing import (
+    xmi_handling as xh,
+    sofa_editing as se,
+    element_editing as ed,
+    complex_operations as co,
+    xmi_conversion_util as xcu,
+    synthetic,
+    regexes
+)
+from automatic_editing.indexed_tree import IndexedTree
+
+
+MODULES = (ed, se, co, xh, xcu)
+
+# Settings and context managers, nothing that scales with a document
+SKIPPED = {
+    'xmi_handling.set_backend',
+    'xmi_handling.get_backend',
+    'xmi_handling.set_compression_level',
+    'xmi_handling.isolated_namespaces',
+}
+
+BENCHMARKS = {}
+
+# Largest number of sentences a benchmark is run with by default. The match
+# by match sofa edits adjust all annotations for every match, so their time
+# grows with the square of the document size
+LIMITS = {
+    'sofa_editing.sofa_regex_delete': 1000,
+    'sofa_editing.sofa_regex_replace': 1000,
+    'sofa_editing.sofa_regex_replace_if': 2000,
+}
+
+
+def benchmark(name):
+    """Registers a benchmark for a function, named 'module.function'.
+    Variants of a function get a suffix after a space.
+
+    The benchmark gets a Document and does its setup, the callable it
+    returns is what gets timed.
+    """
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+class Document:
+    """Synthetic xmi file of a given size, parsed anew for every run."""
+
+    def __init__(self, path, indexed=False):
+        self.path = path
+        self.indexed = indexed
+
+    def parse(self):
+        tree, _, namespaces = xh.get_everything(self.path)
+        if self.indexed:
+            tree = IndexedTree(tree, namespaces)
+        return tree, namespaces
+
+    def coords(self, tree, namespaces, tag):
+        return [
+            xcu.element_coords(element)
+            for element in tree.findall(tag, namespaces)
+        ]
+
+
+def _annotated(tree):
+    return [child for child in tree.getroot() if 'begin' in child.attrib]
+
+
+def _with_metadata(tree, namespaces):
+    """Tree prepared like _automatic_main up to the metadata tags."""
+    tree = se.sofa_regex_replace_if(
+        regexes.ZEITUNG_PATTERN, '###', '+++', tree, namespaces
+    )
+    return co.add_metadata_tag(
+        regexes.ZEITUNG_PATTERN_EDIT,
+        {'{'+namespaces['xmi']+'}id': '1', 'sofa': '1'},
+        tree, namespaces
+    )
+
+
+def _tree_benchmark(name, function, *args, **kwargs):
+    """Registers a benchmark of function(tree, namespaces, ...) or, if
+    args start with None, function(..., tree, namespaces)."""
+    def setup(document):
+        tree, namespaces = document.parse()
+        if args and args[0] is None:
+            return lambda: function(*args[1:], tree, namespaces, **kwargs)
+        return lambda: function(tree, namespaces, *args, **kwargs)
+    BENCHMARKS[name] = setup
+
+
+# element_editing
+
+@benchmark('element_editing.rename_attribute')
+def _(document):
+    tree, _ = document.parse()
+    return lambda: ed.rename_attribute(
+        tree, 'Protagonistinnen2', 'Protagonistinnen4'
+    )
+
+
+@benchmark('element_editing.rename_annotation')
+def _(document):
+    tree, _ = document.parse()
+    return lambda: ed.rename_annotation(
+        tree, 'Protagonistinnen', 'Adressat:in', 'Adresassat:in'
+    )
+
+
+@benchmark('element_editing.change_begin_end')
+def _(document):
+    tree, _ = document.parse()
+    return lambda: ed.change_begin_end(tree, '2', 0, 1)
+
+
+@benchmark('element_editing.remove_attribute')
+def _(document):
+    tree, _ = document.parse()
+    return lambda: ed.remove_attribute(tree, 'Protagonistinnen2')
+
+
+@benchmark('element_editing.make_element')
+def _(document):
+    tree, namespaces = document.parse()
+    tag = '{'+namespaces['custom']+'}Metadata'
+    count = len(tree.findall('type5:Sentence', namespaces))
+
+    def run():
+        for _ in range(count):
+            ed.make_element(tree, tag, {'sofa': '1'})
+    return run
+
+
+@benchmark('element_editing.add_element')
+def _(document):
+    tree, namespaces = document.parse()
+    tag = '{'+namespaces['custom']+'}Metadata'
+    count = len(tree.findall('type5:Sentence', namespaces)) // 10
+
+    def run():
+        for position in range(2, count + 2):
+            ed.add_element(tree, tag, {'sofa': '1'}, position)
+    return run
+
+
+@benchmark('element_editing.remove_elements')
+def _(document):
+    tree, namespaces = document.parse()
+    tokens = tree.findall('type5:Token', namespaces)
+    return lambda: ed.remove_elements(tree, tokens)
+
+
+_tree_benchmark(
+    'element_editing.canonical_order', ed.canonical_order,
+    type_order=['custom:Metadata', 'custom:Span']
+)
+_tree_benchmark('element_editing.update_ids', ed.update_ids)
+_tree_benchmark('element_editing.set_sofa_one', ed.set_sofa_one)
+
+
+@benchmark('element_editing.is_inside_coords')
+def _(document):
+    tree, namespaces = document.parse()
+    sentences = document.coords(tree, namespaces, 'type5:Sentence')
+    tokens = document.coords(tree, namespaces, 'type5:Token')
+    pairs = [(sentences[i * len(sentences) // len(tokens)], token)
+             for i, token in enumerate(tokens)]
+    return lambda: [ed.is_inside_coords(*pair) for pair in pairs]
+
+
+@benchmark('element_editing.push_out_coords')
+def _(document):
+    tree, namespaces = document.parse()
+    tree = _with_metadata(tree, namespaces)
+    text = xh.get_sofa_string(tree, namespaces)
+    bouncers = sorted(document.coords(tree, namespaces, 'custom:Metadata'))
+    spans = document.coords(tree, namespaces, 'custom:Span')
+    return lambda: [
+        ed.push_out_coords(coords, bouncers, text) for coords in spans
+    ]
+
+
+@benchmark('element_editing.push_out_annotations')
+def _(document):
+    tree, namespaces = document.parse()
+    tree = _with_metadata(tree, namespaces)
+    return lambda: ed.push_out_annotations(
+        tree, namespaces, 'custom:Metadata', ['custom:Span']
+    )
+
+
+_tree_benchmark(
+    'element_editing.narrow_all_tag_cords', ed.narrow_all_tag_cords,
+    None, 'custom:Span'
+)
+_tree_benchmark('element_editing.delete_empty_tags', ed.delete_empty_tags)
+_tree_benchmark(
+    'element_editing.delete_overlap_tokens', ed.delete_overlap_tokens
+)
+
+
+@benchmark('element_editing.covered_short_tokens')
+def _(document):
+    tree, namespaces = document.parse()
+    tokens = document.coords(tree, namespaces, 'type5:Token')
+    return lambda: ed.covered_short_tokens(tokens)
+
+
+_tree_benchmark(
+    'element_editing.delete_outside_sentence', ed.delete_outside_sentence
+)
+_tree_benchmark(
+    'element_editing.delete_group_annotation', ed.delete_group_annotation
+)
+_tree_benchmark(
+    'element_editing.delete_whitespace_tokens', ed.delete_whitespace_tokens
+)
+
+
+# sofa_editing
+
+@benchmark('sofa_editing.positional_insert')
+def _(document):
+    tree, namespaces = document.parse()
+    text = xh.get_sofa_string(tree, namespaces)
+    return lambda: se.positional_insert(text, '+++', len(text) // 2)
+
+
+@benchmark('sofa_editing.positional_delete')
+def _(document):
+    tree, namespaces = document.parse()
+    text = xh.get_sofa_string(tree, namespaces)
+    return lambda: se.positional_delete(text, 3, len(text) // 2)
+
+
+@benchmark('sofa_editing.adjust_annotations')
+def _(document):
+    tree, namespaces = document.parse()
+    position = len(xh.get_sofa_string(tree, namespaces)) // 2
+    return lambda: se.adjust_annotations(tree, namespaces, 3, position)
+
+
+@benchmark('sofa_editing.sofa_string_insert')
+def _(document):
+    tree, namespaces = document.parse()
+    position = len(xh.get_sofa_string(tree, namespaces)) // 2
+    return lambda: se.sofa_string_insert(tree, namespaces, '+++', position)
+
+
+@benchmark('sofa_editing.sofa_string_delete')
+def _(document):
+    tree, namespaces = document.parse()
+    position = len(xh.get_sofa_string(tree, namespaces)) // 2
+    return lambda: se.sofa_string_delete(tree, namespaces, 3, position)
+
+
+@benchmark('sofa_editing.next_regex_sofa_coordinates')
+def _(document):
+    tree, namespaces = document.parse()
+    return lambda: list(se.next_regex_sofa_coordinates(
+        regexes.ZEITUNG_PATTERN, tree, namespaces
+    ))
+
+
+for batched in (False, True):
+    suffix = ' batched' if batched else ''
+    _tree_benchmark(
+        'sofa_editing.sofa_regex_delete' + suffix, se.sofa_regex_delete,
+        None, ' ###', batched=batched
+    )
+    _tree_benchmark(
+        'sofa_editing.sofa_regex_replace' + suffix, se.sofa_regex_replace,
+        None, '#', '', batched=batched
+    )
+
+_tree_benchmark(
+    'sofa_editing.sofa_regex_replace_if', se.sofa_regex_replace_if,
+    None, regexes.ZEITUNG_PATTERN, '###', '+++'
+)
+_tree_benchmark(
+    'sofa_editing.sofa_regex_edit_batched', se.sofa_regex_edit_batched,
+    None, '#', ''
+)
+
+
+@benchmark('sofa_editing.regex_sofa_edits')
+def _(document):
+    tree, namespaces = document.parse()
+    text = xh.get_sofa_string(tree, namespaces)
+    return lambda: se.regex_sofa_edits('#', text, '')
+
+
+@benchmark('sofa_editing.offset_tables')
+def _(document):
+    tree, namespaces = document.parse()
+    text = xh.get_sofa_string(tree, namespaces)
+    _, edits = se.regex_sofa_edits('#', text, '')
+    return lambda: se.offset_tables(edits)
+
+
+@benchmark('sofa_editing.remap_offset')
+def _(document):
+    tree, namespaces = document.parse()
+    text = xh.get_sofa_string(tree, namespaces)
+    tables = se.offset_tables(se.regex_sofa_edits('#', text, '')[1])
+    coords = [xcu.element_coords(element) for element in _annotated(tree)]
+    return lambda: [
+        (se.remap_offset(begin, tables), se.remap_offset(end, tables, True))
+        for begin, end in coords
+    ]
+
+
+@benchmark('sofa_editing.adjust_annotations_batched')
+def _(document):
+    tree, namespaces = document.parse()
+    text = xh.get_sofa_string(tree, namespaces)
+    _, edits = se.regex_sofa_edits('#', text, '')
+    return lambda: se.adjust_annotations_batched(tree, namespaces, edits)
+
+
+# complex_operations
+
+@benchmark('complex_operations.add_metadata_tag')
+def _(document):
+    tree, namespaces = document.parse()
+    tree = se.sofa_regex_replace_if(
+        regexes.ZEITUNG_PATTERN, '###', '+++', tree, namespaces
+    )
+    return lambda: co.add_metadata_tag(
+        regexes.ZEITUNG_PATTERN_EDIT,
+        {'{'+namespaces['xmi']+'}id': '1', 'sofa': '1'},
+        tree, namespaces
+    )
+
+
+_tree_benchmark(
+    'complex_operations.correct_sentences', co.correct_sentences,
+    sentence_begin=None
+)
+_tree_benchmark(
+    'complex_operations.delete_keine_moral', co.delete_keine_moral,
+    append=True
+)
+_tree_benchmark(
+    'complex_operations.include_punctuation', co.include_punctuation
+)
+_tree_benchmark(
+    'complex_operations.remove_double_moralizations',
+    co.remove_double_moralizations
+)
+_tree_benchmark(
+    'complex_operations.remove_duplicate_spans', co.remove_duplicate_spans,
+    'KAT1MoralisierendesSegment'
+)
+_tree_benchmark(
+    'complex_operations.cleanup_annotations', co.cleanup_annotations
+)
+
+
+@benchmark('complex_operations.element_is_moralization')
+def _(document):
+    tree, namespaces = document.parse()
+    spans = tree.findall('custom:Span', namespaces)
+    return lambda: [co.element_is_moralization(span) for span in spans]
+
+
+def _policy_benchmark(policy):
+    def setup(document):
+        tree, namespaces = document.parse()
+        groups = {}
+        for span in tree.findall('custom:Span', namespaces):
+            groups.setdefault(xcu.element_coords(span), []).append(span)
+        return lambda: [
+            policy(group, 'KAT1MoralisierendesSegment')
+            for group in groups.values()
+        ]
+    return setup
+
+
+BENCHMARKS['complex_operations.exact_duplicates_lose'] = _policy_benchmark(
+    co.exact_duplicates_lose
+)
+BENCHMARKS['complex_operations.generic_moralization_loses'] = (
+    _policy_benchmark(co.generic_moralization_loses)
+)
+
+
+@benchmark('complex_operations.duplicate_losers')
+def _(document):
+    tree, namespaces = document.parse()
+    spans = tree.findall('custom:Span', namespaces)
+    return lambda: co.duplicate_losers(
+        spans, 'KAT1MoralisierendesSegment', co.generic_moralization_loses
+    )
+
+
+# xmi_handling
+
+def _file_benchmark(function):
+    def setup(document):
+        return lambda: function(document.path)
+    return setup
+
+
+for _function in (
+    xh.parse_xmi, xh.parse_xmi_namespaces, xh.get_everything,
+    xh.get_namespaces
+):
+    BENCHMARKS['xmi_handling.' + _function.__name__] = _file_benchmark(
+        _function
+    )
+
+
+@benchmark('xmi_handling.open_xmi')
+def _(document):
+    def run():
+        with xh.open_xmi(document.path) as file_:
+            return len(file_.read())
+    return run
+
+
+def _write_benchmark(extension, fsync=False):
+    def setup(document):
+        tree, _ = document.parse()
+        output = os.path.join(
+            os.path.dirname(document.path), 'output.xmi' + extension
+        )
+        return lambda: xh.default_write(tree, output, fsync=fsync)
+    return setup
+
+
+BENCHMARKS['xmi_handling.default_write'] = _write_benchmark('')
+BENCHMARKS['xmi_handling.default_write fsync'] = _write_benchmark('', True)
+BENCHMARKS['xmi_handling.default_write gz'] = _write_benchmark('.gz')
+
+
+@benchmark('xmi_handling.xmi_filename_extension')
+def _(document):
+    tree, _ = document.parse()
+    paths = [f'file{i}.xmi.gz' for i in range(len(_annotated(tree)))]
+    return lambda: [xh.xmi_filename_extension(path) for path in paths]
+
+
+@benchmark('xmi_handling.compression_of')
+def _(document):
+    tree, _ = document.parse()
+    paths = [f'file{i}.xmi.gz' for i in range(len(_annotated(tree)))]
+    return lambda: [xh.compression_of(path) for path in paths]
+
+
+_tree_benchmark('xmi_handling.get_sofa_string', xh.get_sofa_string)
+
+
+@benchmark('xmi_handling.qualified_tag')
+def _(document):
+    tree, namespaces = document.parse()
+    tags = [
+        xh.prefixed_tag(element.tag, namespaces)
+        for element in _annotated(tree)
+    ]
+    return lambda: [xh.qualified_tag(tag, namespaces) for tag in tags]
+
+
+@benchmark('xmi_handling.prefixed_tag')
+def _(document):
+    tree, namespaces = document.parse()
+    tags = [element.tag for element in _annotated(tree)]
+    return lambda: [xh.prefixed_tag(tag, namespaces) for tag in tags]
+
+
+@benchmark('xmi_handling.get_position_before_category')
+def _(document):
+    tree, namespaces = document.parse()
+    tag = '{'+namespaces['cas']+'}View'
+    return lambda: xh.get_position_before_category(tree, tag)
+
+
+@benchmark('xmi_handling.get_position_before_element')
+def _(document):
+    tree, namespaces = document.parse()
+    last = tree.findall('custom:Span', namespaces)[-1]
+    return lambda: xh.get_position_before_element(
+        tree, last.tag, dict(last.attrib)
+    )
+
+
+# xmi_conversion_util
+
+def _element_benchmark(function):
+    def setup(document):
+        tree, _ = document.parse()
+        elements = _annotated(tree)
+        return lambda: [function(element) for element in elements]
+    return setup
+
+
+BENCHMARKS['xmi_conversion_util.element_coords'] = _element_benchmark(
+    xcu.element_coords
+)
+BENCHMARKS['xmi_conversion_util.get_coords'] = _element_benchmark(
+    xcu.get_coords
+)
+
+
+@benchmark('xmi_conversion_util.get_span')
+def _(document):
+    tree, namespaces = document.parse()
+    text = xh.get_sofa_string(tree, namespaces)
+    spans = document.coords(tree, namespaces, 'custom:Span')
+    return lambda: [xcu.get_span(text, coords) for coords in spans]
+
+
+@benchmark('xmi_conversion_util.narrow_coords')
+def _(document):
+    tree, namespaces = document.parse()
+    text = xh.get_sofa_string(tree, namespaces)
+    spans = document.coords(tree, namespaces, 'custom:Span')
+    return lambda: [xcu.narrow_coords(coords, text) for coords in spans]
+
+
+@benchmark('xmi_conversion_util.inside_of')
+def _(document):
+    tree, namespaces = document.parse()
+    sentences = document.coords(tree, namespaces, 'type5:Sentence')
+    spans = document.coords(tree, namespaces, 'custom:Span')
+    pairs = [(sentences[i * len(sentences) // len(spans)], span)
+             for i, span in enumerate(spans)]
+    return lambda: [xcu.inside_of(*pair) for pair in pairs]
+
+
+@benchmark('xmi_conversion_util.inside_of_list')
+def _(document):
+    tree, namespaces = document.parse()
+    sentences = xcu.IntervalIndex(
+        document.coords(tree, namespaces, 'type5:Sentence')
+    )
+    spans = document.coords(tree, namespaces, 'custom:Span')
+    return lambda: [xcu.inside_of_list(sentences, span) for span in spans]
+
+
+_tree_benchmark(
+    'xmi_conversion_util.sentence_associations', xcu.sentence_associations,
+    None, 'KAT1MoralisierendesSegment'
+)
+
+
+def unbenchmarked():
+    """Gets the public functions of the benchmarked modules that have no
+    benchmark and are not skipped on purpose."""
+    covered = {name.split(' ')[0] for name in BENCHMARKS} | SKIPPED
+    missing = []
+    for module in MODULES:
+        short = module.__name__.rsplit('.', 1)[-1]
+        for name, function in inspect.getmembers(module, inspect.isfunction):
+            if (
+                function.__module__ == module.__name__
+                and not name.startswith('_')
+                and f'{short}.{name}' not in covered
+            ):
+                missing.append(f'{short}.{name}')
+    return missing
+
+
+def time_benchmark(setup, document, repeat):
+    """Times a benchmark repeat times, each on a freshly parsed document.
+
+    Returns:
+        list: seconds per run
+    """
+    runs = []
+    for _ in range(repeat):
+        run = setup(document)
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        runs.append(time.perf_counter() - start)
+    return runs
+
+
+def run_suite(
+    sizes, repeat=3, names=None, indexed=False, seed=0, limits=True
+):
+    """Runs the benchmarks over synthetic documents of growing size.
+
+    Args:
+        sizes (list): numbers of sentences of the documents
+        repeat (int): runs per benchmark and size, the minimum is reported
+        names (list): substrings, only benchmarks containing one of them
+            are run. All if None
+        indexed (bool): wrap the trees in an IndexedTree
+        seed (int): seed of the generated documents
+        limits (bool): skip benchmarks above their size in LIMITS
+
+    Returns:
+        list: one dict per benchmark and size
+    """
+
+    selected = sorted(
+        name for name in BENCHMARKS
+        if names is None or any(part in name for part in names)
+    )
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'synthetic.xmi')
+        for sentences in sizes:
+            synthetic.write_synthetic_xmi(path, sentences=sentences, seed=seed)
+            document = Document(path, indexed)
+            tree, namespaces = document.parse()
+            sofa_length = len(xh.get_sofa_string(tree, namespaces))
+            elements = len(tree.getroot())
+            del tree
+
+            for name in selected:
+                if limits and sentences > LIMITS.get(name, sentences):
+                    continue
+                runs = time_benchmark(BENCHMARKS[name], document, repeat)
+                results.append({
+                    'function': name,
+                    'sentences': sentences,
+                    'elements': elements,
+                    'sofa_length': sofa_length,
+                    'seconds': min(runs),
+                    'runs': runs,
+                })
+                print(
+                    f'{name:<52} {sentences:>7} sentences '
+                    f'{min(runs):>10.5f}s', flush=True
+                )
+
+    return results
+
+
+parser = argparse.ArgumentParser(
+    description='Times the public functions of automatic_editing on '
+                'synthetic xmi documents of growing size.'
+)
+parser.add_argument(
+    '--sizes', type=int, nargs='+', default=[500, 2000, 8000],
+    help='numbers of sentences of the documents'
+)
+parser.add_argument(
+    '--repeat', type=int, default=3,
+    help='runs per benchmark and size, the minimum is reported'
+)
+parser.add_argument(
+    '--filter', nargs='+',
+    help='only run benchmarks whose name contains one of these'
+)
+parser.add_argument('--backend', help='lxml or etree')
+parser.add_argument(
+    '--indexed', action='store_true', help='wrap the trees in an IndexedTree'
+)
+parser.add_argument(
+    '--no-limits', action='store_true',
+    help='run every benchmark at every size, see LIMITS'
+)
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('--output', help='.json file the results are written to')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    if args.backend:
+        xh.set_backend(args.backend)
+
+    for name in unbenchmarked():
+        print(f'No benchmark for {name}')
+
+    results = run_suite(
+        args.sizes, args.repeat, args.filter, args.indexed, args.seed,
+        not args.no_limits
+    )
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file_:
+            json.dump({
+                'backend': xh.get_backend(),
+                'indexed': args.indexed,
+                'seed': args.seed,
+                'repeat': args.repeat,
+                'results': results,
+            }, file_, indent=2)
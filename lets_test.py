@@ -1,32 +1,19 @@
-from xml.etree import ElementTree as ET
 from automatic_editing import xmi_handling as xh
 from automatic_editing import xmi_conversion_util as xcu
+from automatic_editing import xmi_streaming as xs
 
 
 def print_all_spans(span_list, text):
     for span in span_list:
-        start = int(span.get('begin'))
-        end = int(span.get('end'))
-        print(xcu.get_span(text, (start, end)))
+        print(xcu.get_span(text, (span.begin, span.end)))
         print('-'*30)
 
 
-tree, root = xh.parse_xmi('output.xmi')
-namespaces = xh.get_namespaces('output.xmi')
-text = xh.get_sofa_string(tree, namespaces)
-
-sents = tree.findall('type5:Sentence', namespaces)
-meta = tree.findall('custom:Metadata', namespaces)
-morals = tree.findall('custom:Morals', namespaces)
-morals = [m for m in morals if m.get('KAT1MoralisierendesSegment')]
-
-
 def print_dups(spans, text):
     dups = []
     uniqs = set()
     for sent in spans:
-        span_range = (int(sent.get('begin')), int(sent.get('end')))
-        spantext = xcu.get_span(text, span_range)
+        spantext = xcu.get_span(text, (sent.begin, sent.end))
         if spantext not in uniqs:
             uniqs.add(spantext)
         else:
@@ -38,19 +25,28 @@ def print_dups(spans, text):
 
 
 def print_tokens(file):
-    tree = ET.parse(file)
-    namespaces = xh.get_namespaces(file)
-
-    corpus = xh.get_sofa_string(tree, namespaces)
-    tokens = tree.findall('type5:Token', namespaces)
+    _, corpus, tokens = xs.stream_xmi(file, ['type5:Token'])
 
     for token in tokens:
-        trange = (
-            int(token.get('begin')),
-            int(token.get('end'))
-        )
-        print(corpus[trange[0]:trange[1]], end='')
+        print(corpus[token.begin:token.end], end='')
         print('|', end='')
 
 
-print_all_spans(sents, text)
+if __name__ == '__main__':
+    namespaces, text, records = xs.stream_xmi(
+        'output.xmi', ['type5:Sentence', 'custom:Metadata', 'custom:Morals']
+    )
+    records = list(records)
+
+    def with_tag(tag):
+        tag = xh.qualified_tag(tag, namespaces)
+        return [record for record in records if record.tag == tag]
+
+    sents = with_tag('type5:Sentence')
+    meta = with_tag('custom:Metadata')
+    morals = with_tag('custom:Morals')
+    morals = [
+        m for m in morals if m.attributes.get('KAT1MoralisierendesSegment')
+    ]
+
+    print_all_spans(sents, text)
@@ -6,4 +6,10 @@ setup(
     packages=find_packages(),
     install_requires=[
     ],
+    extras_require={
+        'lxml': ['lxml'],
+        'numpy': ['numpy'],
+        'toml': ['tomli; python_version < "3.11"'],
+        'test': ['pytest'],
+    },
 )
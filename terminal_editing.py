@@ -1,6 +1,9 @@
+import collections
 import time
 from automatic_editing import xmi_handling as xh
 from automatic_editing import xmi_conversion_util as xcu
+from automatic_editing.background_writer import BackgroundWriter
+from automatic_editing.edit_journal import EditJournal
 
 
 def get_moral_prompt():
@@ -22,9 +25,12 @@ def get_moral_prompt():
     return new_annotation
 
 
-def get_context(element, tree, namespaces):
-    sentences = tree.findall('type5:Sentence', namespaces)
+def get_context(element, tree, namespaces, sentence_index=None):
     element_coords = xcu.get_coords(element)
+    if sentence_index is not None:
+        return sentence_index.first_containing(element_coords)
+
+    sentences = tree.findall('type5:Sentence', namespaces)
 
     for sentence in sentences:
         sentence_coords = xcu.get_coords(sentence)
@@ -69,73 +75,258 @@ def sleepif(boolean, waittime):
         time.sleep(waittime)
 
 
-def prompt_moralizations(filepath, wait=True):
+class ReviewSession:
+    """Review state of one xmi file, parsed once for all prompts.
+
+    The spans, the sofaString and an index over the sentences are built up
+    front, so resolving an issue does not depend on the file size.
+    Confirmed corrections are applied to the tree in memory and written to
+    the file every save_every corrections, on save and when the session is
+    left as a context manager.
+
+    Until then, every correction is appended to a journal next to the file
+    (filepath + '.journal'), which costs a single small write. If a session
+    dies before saving, the next session on the file replays the journal.
+
+    With background, the file and the journal are written by a
+    BackgroundWriter, so the next prompt never waits for either. The
+    writer serialises the tree in memory itself; corrections made while
+    it writes are applied once the write is done. Leaving the session
+    waits for the last write, and a session can be entered again.
+
+    Args:
+        filepath (str): xmi file to be reviewed
+        save_every (int): number of corrections after which the file is
+            written. Only on save and exit if None
+        journal (bool): whether to keep a journal of unsaved corrections
+        background (bool): whether to write the file on a separate thread
+    """
+
+    def __init__(self, filepath, save_every=10, journal=True,
+                 background=False):
+        self.filepath = filepath
+        self.tree, _, self.namespaces = xh.get_everything(filepath)
+        self.journal = EditJournal(filepath + '.journal') if journal else None
+        self._positions = {
+            child: position
+            for position, child in enumerate(self.tree.getroot())
+        }
+        self.sofa_string = xh.get_sofa_string(self.tree, self.namespaces)
+        self.spans = self.tree.findall('custom:Span', self.namespaces)
+        self.sentences = xcu.IntervalIndex(
+            self.tree.findall('type5:Sentence', self.namespaces)
+        )
+        self.save_every = save_every
+        self.unsaved = 0
+        self._contexts = {}
 
-    while True:
-        tree, _, namespaces = xh.get_everything(filepath)
-        sofa_string = xh.get_sofa_string(tree, namespaces)
-        annotations = tree.findall('custom:Span', namespaces)
+        if self.journal is not None:
+            self.unsaved = self.journal.replay(self.tree)
+            if self.unsaved:
+                print(
+                    f'Recovered {self.unsaved} unsaved corrections',
+                    f'from {self.journal.path}.\n'
+                )
 
-        faulty_moralizations = [
-            annotation for annotation in annotations
-            if annotation.get('KAT1MoralisierendesSegment') == "Moralisierung"
+        self.writer = BackgroundWriter(self.tree, filepath, self.journal) \
+            if background else None
+
+    def __enter__(self):
+        if self.writer is not None:
+            self.writer.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            self.save()
+        finally:
+            if self.writer is not None:
+                self.writer.close()
+            if self.journal is not None:
+                self.journal.close()
+
+    def issue_queue(self, is_issue):
+        """Gets the spans for which is_issue is true, in document order,
+        and looks up their sentences."""
+        if self.writer is not None:
+            self.writer.settle()
+        queue = [span for span in self.spans if is_issue(span)]
+        for span in queue:
+            self.context(span)
+        return queue
+
+    def context(self, element):
+        """Gets the sentence containing an element, None if there is
+        none."""
+        if element not in self._contexts:
+            self._contexts[element] = get_context(
+                element, self.tree, self.namespaces, self.sentences
+            )
+        return self._contexts[element]
+
+    def apply(self, element, changes):
+        """Applies a confirmed correction to an element.
+
+        Args:
+            element (Element): span to be corrected
+            changes (dict): new value per attribute, None to remove the
+                attribute
+        """
+        get = element.get if self.writer is None else \
+            lambda attribute: self.writer.get(element, attribute)
+        record = [
+            (
+                self._positions[element], element.tag, attribute,
+                get(attribute), value
+            )
+            for attribute, value in changes.items()
         ]
+        if self.writer is not None:
+            self.writer.apply(element, changes)
+            if self.journal is not None:
+                self.writer.record(record)
+        else:
+            if self.journal is not None:
+                self.journal.record(record)
+            for attribute, value in changes.items():
+                if value is None:
+                    element.attrib.pop(attribute, None)
+                else:
+                    element.set(attribute, value)
+        self.unsaved += 1
+        if self.save_every is not None and self.unsaved >= self.save_every:
+            self.save()
+
+    def save(self):
+        """Writes the corrections made so far to the file and clears the
+        journal.
+
+        The file is written with fsync and swapped in atomically, so a
+        crash while writing leaves the old file and the journal intact.
+        With a background writer, the write is only started.
+        """
+        if self.unsaved and self.writer is not None:
+            self.writer.submit(self.unsaved)
+            self.unsaved = 0
+        elif self.unsaved:
+            xh.default_write(self.tree, self.filepath, fsync=True)
+            if self.journal is not None:
+                self.journal.clear()
+            self.unsaved = 0
+
+    def wait_saved(self):
+        """Waits until the corrections made so far are safe on disk, in
+        the journal or in the file.
+
+        Returns:
+            bool: False if there is no journal and corrections are left
+                for a later save
+        """
+        if self.journal is not None:
+            if self.writer is not None:
+                self.writer.wait_recorded()
+            return True
+        if self.unsaved:
+            return False
+        if self.writer is not None:
+            self.writer.flush()
+        return True
+
+
+def _session(filepath):
+    if isinstance(filepath, ReviewSession):
+        return filepath
+    return ReviewSession(filepath)
+
+
+def show_issue(session, issue, message, wait=True, span_name='span'):
+    """Prints the span of an issue and the sentence it is in."""
+    print(message)
+    print(
+        f'The {span_name} is:\n',
+        '+' * 30 + '\n',
+        xcu.get_span(session.sofa_string, xcu.get_coords(issue)).strip(),
+        '\n' + '+' * 30 + '\n',
+        sep=''
+    )
 
-        if len(faulty_moralizations) < 1:
-            print(f"Done with {filepath}!")
-            break
+    sleepif(wait, 0.1)
 
-        next_issue = faulty_moralizations[0]
-        issue_coords = xcu.get_coords(next_issue)
-        print('Found a span whose moralization type was not specified.\n')
-        print(
-            'The span is:\n',
-            '+' * 30 + '\n',
-            xcu.get_span(sofa_string, issue_coords).strip(),
-            '\n' + '+' * 30 + '\n',
-            sep=''
-        )
+    context_coords = xcu.get_coords(session.context(issue))
+    print(
+        'The entire context is:\n',
+        '+' * 30 + '\n',
+        xcu.get_span(session.sofa_string, context_coords).strip(),
+        '\n' + '+' * 30 + '\n',
+        sep=''
+    )
 
-        sleepif(wait, 0.1)
+    sleepif(wait, 0.1)
 
-        context = get_context(next_issue, tree, namespaces)
-        context_coords = xcu.get_coords(context)
-        print(
-            'The entire context is:\n',
-            '+' * 30 + '\n',
-            xcu.get_span(sofa_string, context_coords).strip(),
-            '\n' + '+' * 30 + '\n',
-            sep=''
-        )
 
-        sleepif(wait, 0.1)
+def confirm_translation(user_input, translation, wait=True):
+    """Asks the user to confirm the label an input corresponds to."""
+    sleepif(wait, 0.2)
 
-        user_input = get_moral_prompt()
-        translation = input_to_annotation(user_input)
+    print(
+        f'\nYour input was {user_input}.',
+        f'This corresponds to "{translation}".',
+        'Please make sure this is correct.\n'
+    )
 
-        sleepif(wait, 0.2)
+    confirmation = get_confirmation()
 
-        print(
-            f'\nYour input was {user_input}.',
-            f'This corresponds to "{translation}".',
-            'Please make sure this is correct.\n'
-        )
+    sleepif(wait, 0.2)
 
-        confirmation = get_confirmation()
+    return confirmation
 
-        sleepif(wait, 0.2)
 
-        if confirmation:
-            next_issue.set('KAT1MoralisierendesSegment', translation)
-            xh.default_write(tree, filepath)
-            print('Correction written to file!\n')
+def report_answer(confirmation, wait=True, session=None):
+    if confirmation and (session is None or session.wait_saved()):
+        print('Correction saved!\n')
+    elif confirmation:
+        print('Correction made, it is saved with the next write.\n')
+    else:
+        print('Nothing was changed.')
+        print('You will be prompted to re-do the annotation.\n')
 
-        else:
-            print('Nothing was changed.')
-            print('You will be prompted to re-do the annotation.\n')
+    print('-' * 70, '\n')
+    sleepif(wait, 2)
+
+
+def is_unspecified_moralization(annotation):
+    return annotation.get('KAT1MoralisierendesSegment') == "Moralisierung"
 
-        print('-' * 70, '\n')
-        sleepif(wait, 2)
+
+def prompt_moralizations(filepath, wait=True):
+
+    session = _session(filepath)
+
+    with session:
+        for next_issue in session.issue_queue(is_unspecified_moralization):
+            confirmation = False
+            while not confirmation:
+                show_issue(
+                    session, next_issue,
+                    'Found a span whose moralization type was not '
+                    'specified.\n',
+                    wait
+                )
+
+                user_input = get_moral_prompt()
+                translation = input_to_annotation(user_input)
+
+                confirmation = confirm_translation(
+                    user_input, translation, wait
+                )
+                if confirmation:
+                    session.apply(
+                        next_issue,
+                        {'KAT1MoralisierendesSegment': translation}
+                    )
+                report_answer(confirmation, wait, session)
+
+    print(f"Done with {session.filepath}!")
 
 
 def protagonist_tuple(element):
@@ -236,152 +427,78 @@ def get_possible_malefiz():
 
 def prompt_missing(filepath, wait=True):
 
-    while True:
-        tree, _, namespaces = xh.get_everything(filepath)
-        sofa_string = xh.get_sofa_string(tree, namespaces)
-        annotations = tree.findall('custom:Span', namespaces)
-
-        faulty_moralizations = [
-            annotation for annotation in annotations
-            if missing_annotation(protagonist_tuple(annotation))
-        ]
-
-        if len(faulty_moralizations) < 1:
-            print(f"Done with {filepath}!")
-            break
-
-        next_issue = faulty_moralizations[0]
-        issue_coords = xcu.get_coords(next_issue)
-        print('Found a protagonist with missing annotations.\n')
-        print(
-            'The protagonist span is:\n',
-            '+' * 30 + '\n',
-            xcu.get_span(sofa_string, issue_coords).strip(),
-            '\n' + '+' * 30 + '\n',
-            sep=''
-        )
-
-        sleepif(wait, 0.1)
-
-        context = get_context(next_issue, tree, namespaces)
-        context_coords = xcu.get_coords(context)
-        print(
-            'The entire context is:\n',
-            '+' * 30 + '\n',
-            xcu.get_span(sofa_string, context_coords).strip(),
-            '\n' + '+' * 30 + '\n',
-            sep=''
-        )
-
-        sleepif(wait, 0.1)
-
-        category = 0 if not protagonist_tuple(next_issue)[0] else 1
-        user_input = get_protagonist_prompt(protagonist_tuple(next_issue))
-        translation = input_to_protagonist_anno(user_input, category)
-
-        sleepif(wait, 0.2)
+    session = _session(filepath)
 
-        print(
-            f'\nYour input was {user_input}.',
-            f'This corresponds to "{translation}".',
-            'Please make sure this is correct.\n'
+    with session:
+        queue = session.issue_queue(
+            lambda annotation: missing_annotation(
+                protagonist_tuple(annotation)
+            )
         )
+        for next_issue in queue:
+            confirmation = False
+            while not confirmation:
+                show_issue(
+                    session, next_issue,
+                    'Found a protagonist with missing annotations.\n',
+                    wait, 'protagonist span'
+                )
 
-        confirmation = get_confirmation()
+                category = 0 if not protagonist_tuple(next_issue)[0] else 1
+                user_input = get_protagonist_prompt(
+                    protagonist_tuple(next_issue)
+                )
+                translation = input_to_protagonist_anno(user_input, category)
 
-        sleepif(wait, 0.2)
+                confirmation = confirm_translation(
+                    user_input, translation, wait
+                )
+                if confirmation:
+                    attribute = (
+                        'Protagonistinnen', 'Protagonistinnen2'
+                    )[category]
+                    session.apply(next_issue, {attribute: translation})
+                report_answer(confirmation, wait, session)
 
-        if confirmation and category == 0:
-            next_issue.set('Protagonistinnen', translation)
-            xh.default_write(tree, filepath)
-            print('Correction written to file!\n')
-        elif confirmation and category == 1:
-            next_issue.set('Protagonistinnen2', translation)
-            xh.default_write(tree, filepath)
-            print('Correction written to file!\n')
+    print(f"Done with {session.filepath}!")
 
-        else:
-            print('Nothing was changed.')
-            print('You will be prompted to re-do the annotation.\n')
 
-        print('-' * 70, '\n')
-        sleepif(wait, 2)
+def is_kein_bezug(annotation):
+    return annotation.get('Protagonistinnen') == "Kein Bezug"
 
 
 def prompt_bezug(filepath, wait=True):
 
+    session = _session(filepath)
     seen_bezuglos = set()
 
-    while True:
-        tree, _, namespaces = xh.get_everything(filepath)
-        sofa_string = xh.get_sofa_string(tree, namespaces)
-        annotations = tree.findall('custom:Span', namespaces)
-
-        faulty_moralizations = [
-            annotation for annotation in annotations
-            if annotation.get('Protagonistinnen') == "Kein Bezug"
-            and (annotation.get('begin'), annotation.get('end'))
-            not in seen_bezuglos
-        ]
-
-        if len(faulty_moralizations) < 1:
-            print(f"Done with {filepath}!")
-            break
-
-        next_issue = faulty_moralizations[0]
-        issue_coords = xcu.get_coords(next_issue)
-        print('Found a protagonist with "Kein Bezug".\n')
-        print(
-            'The protagonist span is:\n',
-            '+' * 30 + '\n',
-            xcu.get_span(sofa_string, issue_coords).strip(),
-            '\n' + '+' * 30 + '\n',
-            sep=''
-        )
-
-        sleepif(wait, 0.1)
-
-        context = get_context(next_issue, tree, namespaces)
-        context_coords = xcu.get_coords(context)
-        print(
-            'The entire context is:\n',
-            '+' * 30 + '\n',
-            xcu.get_span(sofa_string, context_coords).strip(),
-            '\n' + '+' * 30 + '\n',
-            sep=''
-        )
-
-        sleepif(wait, 0.1)
-
-        user_input = get_possible_malefiz()
-        translation = input_to_protagonist_anno(user_input, 0)
-
-        sleepif(wait, 0.2)
-
-        print(
-            f'\nYour input was {user_input}.',
-            f'This corresponds to "{translation}".',
-            'Please make sure this is correct.\n'
-        )
-
-        confirmation = get_confirmation()
-
-        sleepif(wait, 0.2)
+    with session:
+        for next_issue in session.issue_queue(is_kein_bezug):
+            coords = (next_issue.get('begin'), next_issue.get('end'))
+            if coords in seen_bezuglos:
+                continue
+            confirmation = False
+            while not confirmation:
+                show_issue(
+                    session, next_issue,
+                    'Found a protagonist with "Kein Bezug".\n',
+                    wait, 'protagonist span'
+                )
 
-        if confirmation:
-            next_issue.set('Protagonistinnen', translation)
-            xh.default_write(tree, filepath)
-            print('Correction written to file!\n')
-            seen_bezuglos.add(
-                (next_issue.get('begin'), next_issue.get('end'))
-            )
+                user_input = get_possible_malefiz()
+                translation = input_to_protagonist_anno(user_input, 0)
 
-        else:
-            print('Nothing was changed.')
-            print('You will be prompted to re-do the annotation.\n')
+                confirmation = confirm_translation(
+                    user_input, translation, wait
+                )
+                if confirmation:
+                    session.apply(
+                        next_issue, {'Protagonistinnen': translation}
+                    )
+                    seen_bezuglos.add(coords)
+                report_answer(confirmation, wait, session)
 
-        print('-' * 70, '\n')
-        sleepif(wait, 2)
+    print(f"Done with {session.filepath}!")
 
 
 def input_to_other_anno(letter):
@@ -418,102 +535,310 @@ def get_possible_other():
     return new_annotation
 
 
+def is_other(annotation):
+    return (
+        annotation.get('Protagonistinnen2') == "OTHER"
+        or annotation.get('KAT2Subjektive_Ausdrcke') == 'OTHER'
+        or annotation.get('Moralwerte') == 'OTHER'
+    )
+
+
+def other_category(annotation):
+    """Gets the attribute an "OTHER" was annotated in, None if none."""
+    for attribute in (
+        'Protagonistinnen2', 'KAT2Subjektive_Ausdrcke', 'Moralwerte'
+    ):
+        if annotation.get(attribute) == 'OTHER':
+            return attribute
+    return None
+
+
+def other_changes(translation):
+    """Gets the attribute changes that move an "OTHER" to the category
+    chosen with input_to_other_anno."""
+    if translation == 'Protagonistinnen2':
+        return {
+            'Protagonistinnen2': 'OTHER',
+            'KAT2Subjektive_Ausdrcke': None,
+            'Moralwerte': None,
+        }
+    if translation == 'Moralwerte':
+        return {
+            'Moralwerte': 'OTHER',
+            'Protagonistinnen2': None,
+            'Protagonistinnen': None,
+            'KAT2Subjektive_Ausdrcke': None,
+        }
+    return {
+        'KAT2Subjektive_Ausdrcke': 'OTHER',
+        'Protagonistinnen': None,
+        'Protagonistinnen2': None,
+        'Moralwerte': None,
+    }
+
+
 def prompt_other(filepath, wait=True):
+
+    session = _session(filepath)
     seen_other = set()
 
-    while True:
-        tree, _, namespaces = xh.get_everything(filepath)
-        sofa_string = xh.get_sofa_string(tree, namespaces)
-        annotations = tree.findall('custom:Span', namespaces)
-
-        faulty_moralizations = [
-            annotation for annotation in annotations
-            if (annotation.get('Protagonistinnen2') == "OTHER" or annotation.get('KAT2Subjektive_Ausdrcke') == 'OTHER' or annotation.get('Moralwerte') == 'OTHER')
-            and (annotation.get('begin'), annotation.get('end'))
-            not in seen_other
-        ]
+    with session:
+        for next_issue in session.issue_queue(is_other):
+            coords = (next_issue.get('begin'), next_issue.get('end'))
+            if coords in seen_other:
+                continue
+            confirmation = False
+            while not confirmation:
+                category = other_category(next_issue)
+                show_issue(
+                    session, next_issue,
+                    'Found a span with "OTHER".\n'
+                    '"OTHER" was annotated in the context of: '
+                    + (category or str(next_issue.attrib)) + '\n',
+                    wait
+                )
 
-        if len(faulty_moralizations) < 1:
-            print(f"Done with {filepath}!")
-            break
-
-        next_issue = faulty_moralizations[0]
-
-        issue_coords = xcu.get_coords(next_issue)
-        print('Found a span with "OTHER".')
-        print('"OTHER" was annotated in the context of: ', end="")
-        if next_issue.get('Protagonistinnen2') == 'OTHER':
-            print('Protagonistinnen2')
-        elif next_issue.get('KAT2Subjektive_Ausdrcke') == 'OTHER':
-            print('KAT2Subjektive_Ausdrcke\n')
-        elif next_issue.get('Moralwerte') == 'OTHER':
-            print('Moralwerte\n')
-        else:
-            print(next_issue.attrib)
-        print(
-            'The span is:\n',
-            '+' * 30 + '\n',
-            xcu.get_span(sofa_string, issue_coords).strip(),
-            '\n' + '+' * 30 + '\n',
-            sep=''
-        )
+                user_input = get_possible_other()
+                translation = input_to_other_anno(user_input)
 
-        sleepif(wait, 0.1)
+                confirmation = confirm_translation(
+                    user_input, translation, wait
+                )
+                if confirmation:
+                    session.apply(next_issue, other_changes(translation))
+                    seen_other.add(coords)
+                report_answer(confirmation, wait, session)
+
+    print(f"Done with {session.filepath}!")
+
+
+def render_issue(session, number, issue, note=None):
+    """Prints an issue of a batch page: its number, the span and the
+    sentence it is in, with the span marked by [[ ]], and a note on the
+    issue below if given."""
+    begin, end = xcu.get_coords(issue)
+    context = session.context(issue)
+    if context is None:
+        context_begin, context_end = begin, end
+    else:
+        context_begin, context_end = xcu.get_coords(context)
+    text = session.sofa_string
+    print(
+        f'({number}) ',
+        text[context_begin:begin].lstrip(),
+        '[[', text[begin:end], ']]',
+        text[end:context_end].rstrip(),
+        '' if note is None else '\n    ' + note,
+        '\n',
+        sep=''
+    )
 
-        context = get_context(next_issue, tree, namespaces)
-        context_coords = xcu.get_coords(context)
-        print(
-            'The entire context is:\n',
-            '+' * 30 + '\n',
-            xcu.get_span(sofa_string, context_coords).strip(),
-            '\n' + '+' * 30 + '\n',
-            sep=''
-        )
 
-        sleepif(wait, 0.1)
+def format_options(legend):
+    return ', '.join(f'{letter} = {label}' for letter, label in legend)
 
-        user_input = get_possible_other()
-        translation = input_to_other_anno(user_input)
 
-        sleepif(wait, 0.2)
+def moralization_answer(issue, letter):
+    return {'KAT1MoralisierendesSegment': input_to_annotation(letter)}
 
-        print(
-            f'\nYour input was {user_input}.',
-            f'This corresponds to "{translation}".',
-            'Please make sure this is correct.\n'
-        )
 
-        confirmation = get_confirmation()
-
-        sleepif(wait, 0.2)
-
-        if confirmation:
-            if translation == 'Protagonistinnen2':
-                next_issue.set('Protagonistinnen2', 'OTHER')
-                next_issue.attrib.pop('KAT2Subjektive_Ausdrcke', None)
-                next_issue.attrib.pop('Moralwerte', None)
-            elif translation == 'Moralwerte':
-                next_issue.set('Moralwerte', 'OTHER')
-                next_issue.attrib.pop('Protagonistinnen2', None)
-                next_issue.attrib.pop('Protagonistinnen', None)
-                next_issue.attrib.pop('KAT2Subjektive_Ausdrcke', None)
-            elif translation == 'KAT2Subjektive_Ausdrcke':
-                next_issue.set('KAT2Subjektive_Ausdrcke', 'OTHER')
-                next_issue.attrib.pop('Protagonistinnen', None)
-                next_issue.attrib.pop('Protagonistinnen2', None)
-                next_issue.attrib.pop('Moralwerte', None)
-            xh.default_write(tree, filepath)
-            print('Correction written to file!\n')
-            seen_other.add(
-                (next_issue.get('begin'), next_issue.get('end'))
-            )
+PROTAGONIST_LETTERS = (
+    ('A', 'B', 'F', 'M', 'KB'), ('sG', 'Ist', 'Ivd', 'Mn', 'O')
+)
 
-        else:
-            print('Nothing was changed.')
-            print('You will be prompted to re-do the annotation.\n')
 
-        print('-' * 70, '\n')
-        sleepif(wait, 2)
+def missing_category(issue):
+    """Gets 0 if the Rolle (Protagonistinnen) of a protagonist is missing,
+    1 if its Gruppe (Protagonistinnen2) is."""
+    return 0 if not protagonist_tuple(issue)[0] else 1
+
+
+def missing_answer(issue, letter):
+    category = missing_category(issue)
+    attribute = ('Protagonistinnen', 'Protagonistinnen2')[category]
+    return {attribute: input_to_protagonist_anno(letter, category)}
+
+
+def missing_legend(issue):
+    category = missing_category(issue)
+    return [
+        (letter, input_to_protagonist_anno(letter, category))
+        for letter in PROTAGONIST_LETTERS[category]
+    ]
+
+
+def missing_note(issue):
+    return f'Label {("Rolle", "Gruppe")[missing_category(issue)]} is missing.'
+
+
+def bezug_answer(issue, letter):
+    return {'Protagonistinnen': input_to_protagonist_anno(letter, 0)}
+
+
+def other_answer(issue, letter):
+    return other_changes(input_to_other_anno(letter))
+
+
+def other_note(issue):
+    return (
+        '"OTHER" was annotated in the context of: '
+        + (other_category(issue) or str(issue.attrib))
+    )
+
+
+# Per check: issue test, answer to changes, legend of the answers (or a
+# function getting the legend of an issue) and a function getting a note
+# on an issue, or None
+BATCH_CHECKS = {
+    'moralizations': (
+        is_unspecified_moralization, moralization_answer,
+        [(letter, input_to_annotation(letter)) for letter in 'WKEI'],
+        None
+    ),
+    'missing': (
+        lambda annotation: missing_annotation(protagonist_tuple(annotation)),
+        missing_answer, missing_legend, missing_note
+    ),
+    'bezug': (
+        is_kein_bezug, bezug_answer,
+        [
+            (letter, input_to_protagonist_anno(letter, 0))
+            for letter in PROTAGONIST_LETTERS[0]
+        ],
+        None
+    ),
+    'other': (
+        is_other, other_answer,
+        [(letter, input_to_other_anno(letter)) for letter in ('Pr', 'Mw', 'SA')],
+        other_note
+    ),
+}
+
+
+def parse_page_answers(page, answers, answer_to_changes):
+    """Validates the answers to a page of issues.
+
+    Args:
+        page (list): issues on the page
+        answers (str): one answer per issue, separated by whitespace,
+            '-' to skip an issue
+        answer_to_changes (callable): gets an issue and an answer, returns
+            the attribute changes or raises ValueError
+
+    Returns:
+        tuple: list of (issue, changes) for the issues not skipped, and a
+            list of error messages (empty if all answers are valid)
+    """
+    answers = answers.split()
+    if len(answers) != len(page):
+        return [], [
+            f'Expected {len(page)} answers, got {len(answers)}.'
+        ]
+
+    corrections = []
+    errors = []
+    for number, (issue, answer) in enumerate(zip(page, answers), 1):
+        if answer == '-':
+            continue
+        try:
+            corrections.append((issue, answer_to_changes(issue, answer)))
+        except ValueError:
+            errors.append(f'({number}) {answer} is not a valid option.')
+    return corrections, errors
+
+
+def batch_review(filepath, check, page_size=10):
+    """Reviews the issues of a check a page at a time.
+
+    Every page shows page_size issues with their context and takes the
+    answers to all of them in one line, validated with the same label
+    tables as the single-issue prompts. The corrections of a page are
+    written with a single save. Typing q saves and stops.
+
+    Args:
+        filepath (str or ReviewSession): xmi file to be reviewed
+        check (str): 'moralizations', 'missing', 'bezug' or 'other'
+        page_size (int): number of issues per page
+    """
+
+    if check not in BATCH_CHECKS:
+        raise ValueError(
+            f'Unknown check {check}, choose from {list(BATCH_CHECKS)}.'
+        )
+    is_issue, answer_to_changes, legend, note = BATCH_CHECKS[check]
+
+    if isinstance(filepath, ReviewSession):
+        session = filepath
+    else:
+        session = ReviewSession(filepath, save_every=None)
+    pending = collections.deque(session.issue_queue(is_issue))
+    # Like the single prompts, answered "Kein Bezug" and "OTHER" spans
+    # also settle later spans with the same coordinates. Those are held
+    # back until the page with the first one is answered
+    settles = check in ('bezug', 'other')
+    seen = set()
+    stopped = False
+
+    with session:
+        while pending and not stopped:
+            page = []
+            held_back = []
+            on_page = set()
+            while pending and len(page) < page_size:
+                issue = pending.popleft()
+                coords = (issue.get('begin'), issue.get('end'))
+                if coords in seen:
+                    continue
+                if settles and coords in on_page:
+                    held_back.append(issue)
+                    continue
+                on_page.add(coords)
+                page.append(issue)
+            pending.extendleft(reversed(held_back))
+            if not page:
+                break
+
+            for number, issue in enumerate(page, 1):
+                lines = [] if note is None else [note(issue)]
+                if callable(legend):
+                    lines.append('Options: ' + format_options(legend(issue)))
+                render_issue(
+                    session, number, issue, '\n    '.join(lines) or None
+                )
+            if not callable(legend):
+                print('Options:', format_options(legend))
+
+            while True:
+                answers = input(
+                    f'Answers for the {len(page)} spans ("-" skips, '
+                    '"q" quits): '
+                )
+                if answers.strip() == 'q':
+                    stopped = True
+                    break
+                corrections, errors = parse_page_answers(
+                    page, answers, answer_to_changes
+                )
+                if not errors:
+                    break
+                print('\n'.join(errors))
+            if stopped:
+                break
+
+            for issue, changes in corrections:
+                session.apply(issue, changes)
+                if settles:
+                    seen.add((issue.get('begin'), issue.get('end')))
+            session.save()
+            session.wait_saved()
+            print(f'Saved {len(corrections)} corrections.\n')
+            print('-' * 70, '\n')
+
+    # Leaving the session waited for the last write
+    if stopped:
+        print(f'Stopped, corrections saved to {session.filepath}.')
+        return
+    print(f"Done with {session.filepath}!")
 
 
 if __name__ == '__main__':
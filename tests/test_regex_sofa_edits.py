@@ -0,0 +1,94 @@
+"""Differential check of the single-pass sofa edits (regex_sofa_edits, used
+with batched=True) against the match by match sofa_regex_delete and
+sofa_regex_replace."""
+import copy
+import random
+import re
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from automatic_editing import sofa_editing as se
+
+
+NAMESPACES = {
+    'xmi': 'http://www.omg.org/XMI',
+    'cas': 'http:///uima/cas.ecore',
+    'type5': 'http:///de/tudarmstadt/ukp/dkpro/core/api/segmentation/'
+             'type.ecore',
+    'custom': 'http:///webanno/custom.ecore',
+}
+# Plain, repeated, alternative, lookbehind, word boundary, lazy, optional
+# and backreference patterns, with and without context before the match
+PATTERNS = [
+    ' ###', '#', '##', 'a#|b', 'x+', ' #+', r'\bab', '(?<=a)#', 'a.*?#',
+    '#\n?#', r'(#)\1', '(?<!b)a',
+]
+INSERTIONS = [None, '', '+', '+++', '#', 'abcdefg']
+ALPHABET = 'ab #\nx'
+
+
+def random_tree(rng, length):
+    text = ''.join(rng.choice('ab #\n#x') for _ in range(length))
+    root = ET.Element('{%s}XMI' % NAMESPACES['xmi'])
+    ET.SubElement(root, '{%s}Sofa' % NAMESPACES['cas'], sofaString=text)
+    for tag in (
+        '{%s}Token' % NAMESPACES['type5'],
+        '{%s}Sentence' % NAMESPACES['type5'],
+        '{%s}Span' % NAMESPACES['custom'],
+    ):
+        for _ in range(rng.randint(0, 15)):
+            begin = rng.randint(0, length)
+            end = rng.randint(begin, length)
+            ET.SubElement(root, tag, begin=str(begin), end=str(end))
+    return ET.ElementTree(root)
+
+
+def matches_again(pattern, insertion):
+    """Whether a match can overlap the insertion once it is surrounded by
+    text. The match by match functions never finish for such cases."""
+    if not insertion:
+        return False
+    compiled = re.compile(pattern)
+    for before in [''] + list(ALPHABET):
+        for after in [''] + list(ALPHABET):
+            text = before + insertion + after
+            end = len(before) + len(insertion)
+            for match_ in compiled.finditer(text):
+                if match_.start() < end and match_.end() > len(before):
+                    return True
+    return False
+
+
+def edited(tree, pattern, insertion, batched):
+    try:
+        if insertion is None:
+            se.sofa_regex_delete(pattern, tree, NAMESPACES, batched=batched)
+        else:
+            se.sofa_regex_replace(
+                pattern, insertion, tree, NAMESPACES, batched=batched
+            )
+    except ValueError as error:
+        return str(error)
+    return ET.tostring(tree.getroot())
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_batched_edits_match_per_match_edits(seed):
+    rng = random.Random(seed)
+    for case in range(1000):
+        tree = random_tree(rng, rng.randint(0, 60))
+        pattern = rng.choice(PATTERNS)
+        insertion = rng.choice(INSERTIONS)
+        if matches_again(pattern, insertion):
+            continue
+        expected = edited(copy.deepcopy(tree), pattern, insertion, False)
+        actual = edited(tree, pattern, insertion, True)
+        assert actual == expected, (seed, case, pattern, insertion)
+
+
+def test_regex_sofa_edits_reports_edits_in_order():
+    text = 'a ### b ### c'
+    new_string, edits = se.regex_sofa_edits(' ###', text, '')
+    assert new_string == 'a b c'
+    assert edits == [(1, -4), (1, 0), (3, -4), (3, 0)]
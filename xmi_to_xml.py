@@ -1,5 +1,18 @@
-import sofa_editing as se
-import xmi_handling as xh
+from xml.sax.saxutils import escape, quoteattr
+from automatic_editing import (
+    sofa_editing as se,
+    xmi_handling as xh
+)
+
+
+# Attribute category -> (inline tag, fixed attributes of the tag)
+CATEGORY_TAGS = {
+    'KAT1MoralisierendesSegment': ('Moralization', {}),
+    'KAT2Subjektive_Ausdrcke': (
+        'MoralValue', {'type': 'subjective expression'}
+    ),
+}
+IGNORED_LABELS = {'Keine Moralisierung'}
 
 
 def retrieve_labels(items):
@@ -56,14 +69,71 @@ def tag_subj_values(tree, namespaces):
     return tree
 
 
+def span_events(tree, namespaces, categories):
+    """Collects the open and close events of all tagged spans.
+
+    Events are sorted by offset. At the same offset, spans are closed
+    before new ones are opened, longer spans open first and close last,
+    and empty spans are opened and closed in between.
+
+    Returns:
+        list: sorted (offset, order, tag string) tuples
+    """
+    events = []
+    index = 0
+    for custom in tree.getroot().findall('custom:Span', namespaces):
+        begin = int(custom.get('begin'))
+        end = int(custom.get('end'))
+        for category in categories:
+            label = custom.get(category)
+            if not label or label in IGNORED_LABELS:
+                continue
+            tag, attributes = CATEGORY_TAGS[category]
+            attributes = {**attributes, 'label': label}
+            opening = '<{}{}>'.format(tag, ''.join(
+                f' {key}={quoteattr(value)}'
+                for key, value in attributes.items()
+            ))
+            closing = f'</{tag}>'
+            if begin == end:
+                events.append((begin, (1, index), opening + closing))
+            else:
+                events.append((begin, (2, -end, index), opening))
+                events.append((end, (0, -begin, -index), closing))
+            index += 1
+    events.sort(key=lambda event: event[:2])
+    return events
+
+
+def render_inline_xml(tree, namespaces, categories=tuple(CATEGORY_TAGS)):
+    """Renders the sofaString with inline tags for the given categories.
+
+    Unlike tag_moralizations and tag_subj_values, the tags are streamed
+    into the text in one pass and the tree is left untouched.
+
+    Args:
+        tree (ElementTree object): tree containing the annotations
+        namespaces (dict): namespace dictionary the tree uses
+        categories (iterable): attribute categories from CATEGORY_TAGS
+            whose spans should be tagged
+
+    Returns:
+        str: escaped sofaString with the inline tags
+    """
+    text = xh.get_sofa_string(tree, namespaces)
+    parts = []
+    position = 0
+    for offset, _, tag in span_events(tree, namespaces, categories):
+        if offset > position:
+            parts.append(escape(text[position:offset]))
+            position = offset
+        parts.append(tag)
+    parts.append(escape(text[position:]))
+    return ''.join(parts)
+
+
 if __name__ == "__main__":
     FILE = 'text.xmi'
-    tree, root = xh.parse_xmi(FILE)
-    namespaces = xh.get_namespaces(FILE)
-
-    tree = tag_moralizations(tree, namespaces)
-    tree = tag_subj_values(tree, namespaces)
+    tree, root, namespaces = xh.get_everything(FILE)
 
-    sofa = tree.find('cas:Sofa', namespaces)
-    sofa_string = sofa.get('sofaString')
-    print(sofa_string)
+    print(render_inline_xml(tree, namespaces))